@@ -1,14 +1,37 @@
 import psycopg2
-import select
+import psycopg2.pool
+from psycopg2.extras import execute_values
+import selectors
 import socket
 import sys
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import threading
 from datetime import datetime
 import time
 import queue
-import base64
+try:
+    # SIMD-accelerated drop-in for the stdlib module; falls back when not installed.
+    import pybase64 as base64
+except ImportError:
+    import base64
+import functools
+import gzip
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from contextlib import contextmanager
+from decimal import Decimal
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Network configuration for connecting to the Node.js server.
 # The script first attempts to connect on the local network. If that fails, it uses a fallback host.
@@ -22,18 +45,55 @@ NODE_PORT = 3030
 # to communicate back to the client.
 FALLBACK_CLIENT_ADDRESS_OVERRIDE = ""
 
+# Request bodies larger than this are gzip-compressed when going over the fallback host.
+COMPRESS_MIN_BYTES = 4096
+
 # Friendly name for this client (sent on registration)
 CLIENT_NAME = socket.gethostname()
 
+# Send outbox_inference batches as MessagePack so bytea columns travel as raw bytes
+# instead of base64 inside JSON. Set to False (or leave msgpack uninstalled) to use JSON.
+INFERENCE_USE_MSGPACK = msgpack is not None
+
+def _probe_host(host):
+    try:
+        socket.create_connection((host, NODE_PORT), timeout=2).close()
+        return True
+    except Exception:
+        print(f"[{datetime.now()}] Could not connect to Node server host: {host}")
+        return False
+
+
+def _probe_hosts_once():
+    # Probe both hosts at once. The LAN host wins as soon as it answers; the fallback
+    # is only used once the LAN probe has failed.
+    # The 2.5s as_completed timeout only bounds how long we wait for an answer, not the
+    # probes themselves: create_connection's timeout covers the TCP connect, but a probe
+    # stuck in DNS resolution keeps running until getaddrinfo returns. The pool is per call
+    # and shut down without waiting, so such a straggler never holds up a later probe.
+    pool = ThreadPoolExecutor(max_workers=2)
+    futures = {pool.submit(_probe_host, h): h for h in (LAN_SERVER_IP, FALLBACK_SERVER_HOST)}
+    fallback_ok = False
+    try:
+        for f in as_completed(futures, timeout=2.5):
+            if not f.result():
+                continue
+            if futures[f] == LAN_SERVER_IP:
+                return LAN_SERVER_IP
+            fallback_ok = True
+    except FuturesTimeoutError:
+        pass
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return FALLBACK_SERVER_HOST if fallback_ok else None
+
+
 def _select_node_host(max_retries=5, delay_seconds=5):
     for attempt in range(1, max_retries + 1):
-        for host in (LAN_SERVER_IP, FALLBACK_SERVER_HOST):
-            try:
-                socket.create_connection((host, NODE_PORT), timeout=2).close()
-                print(f"[{datetime.now()}] Selected Node server host: {host}")
-                return host
-            except Exception:
-                print(f"[{datetime.now()}] Could not connect to Node server host: {host}")
+        host = _probe_hosts_once()
+        if host:
+            print(f"[{datetime.now()}] Selected Node server host: {host}")
+            return host
         
         if attempt < max_retries:
             print(f"[{datetime.now()}] Attempt {attempt} failed. Retrying in {delay_seconds} seconds...")
@@ -48,6 +108,142 @@ SELECTED_NODE_HOST = _select_node_host()
 USE_OVERRIDE = (SELECTED_NODE_HOST == FALLBACK_SERVER_HOST and bool(FALLBACK_CLIENT_ADDRESS_OVERRIDE))
 NODE_BASE_URL = f"http://{SELECTED_NODE_HOST}:{NODE_PORT}"
 
+# One pooled HTTP session for every POST to the Node server, so notifications reuse
+# keep-alive connections instead of opening a new TCP connection per request.
+# This stays on HTTP/1.1: the Express server speaks plain http:// without h2c, so an
+# HTTP/2 client would negotiate HTTP/1.1 anyway. Bursts are instead coalesced into
+# single POSTs (see queue_status / dispatch_notifications), and concurrent workers each
+# get their own pooled connection (pool_maxsize covers every worker thread).
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=2, backoff_factor=0.1),
+))
+SESSION.headers["Connection"] = "keep-alive"
+
+# Local database. Workers borrow connections from a small pool instead of paying a
+# connect + auth round trip on every notification; the LISTEN connection stays dedicated.
+# minconn=0: connections open on first use, so a Postgres that is still starting (or
+# briefly down) fails only the call that hit it instead of the import.
+DB_PARAMS = {"dbname": "base", "user": "postgres", "password": "postgres", "host": "localhost"}
+DB_POOL = psycopg2.pool.ThreadedConnectionPool(0, 8, **DB_PARAMS)
+_thread_db = threading.local()
+
+
+def _connection_alive(conn):
+    if conn.closed:
+        return False
+    try:
+        if conn.status != psycopg2.extensions.STATUS_READY:
+            conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def pin_db_connection():
+    """
+    Bind a pooled connection to the calling thread for the lifetime of the process.
+    Used by the long-running worker threads so they never go back to the pool.
+    """
+    while True:
+        try:
+            _thread_db.conn = DB_POOL.getconn()
+            return
+        except psycopg2.OperationalError as e:
+            print(f"[{datetime.now()}] Could not open worker DB connection: {e}; retrying in 5s...")
+            time.sleep(5)
+
+
+@contextmanager
+def db_connection():
+    """
+    Yield an autocommit connection: the thread's pinned one if it has one, otherwise
+    one borrowed from DB_POOL. Connections that fail a health check after an error
+    are discarded instead of being handed out again.
+    """
+    conn = getattr(_thread_db, "conn", None)
+    pinned = conn is not None
+    if not pinned:
+        conn = DB_POOL.getconn()
+    broken = False
+    try:
+        if conn.status != psycopg2.extensions.STATUS_READY:
+            conn.rollback()
+        conn.autocommit = True
+        yield conn
+    except Exception:
+        broken = not _connection_alive(conn)
+        raise
+    finally:
+        if pinned and broken:
+            _thread_db.conn = None
+        if broken or not pinned:
+            DB_POOL.putconn(conn, close=broken)
+
+
+if hasattr(base64, "b64encode_as_string"):
+    # pybase64 >= 1.3 encodes straight from the buffer to a str in one C call.
+    b64encode_str = base64.b64encode_as_string
+else:
+    def b64encode_str(data):
+        return base64.b64encode(data).decode('ascii')
+
+
+def _serialize_default(obj):
+    # Row values the serializers don't handle natively: timestamps from the
+    # stdlib/msgpack paths, and numeric columns (e.g. confidence) as Decimal.
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def loads_json(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def post_body(url, body, content_type, timeout):
+    """
+    POST an already-encoded body (bytes) to the Node server. Over the fallback
+    (Tailscale) path, bodies above COMPRESS_MIN_BYTES are gzipped; express's body
+    parsers inflate Content-Encoding: gzip on their own.
+    """
+    headers = {"Content-Type": content_type}
+    if USE_OVERRIDE and len(body) > COMPRESS_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=3)
+        headers["Content-Encoding"] = "gzip"
+    return SESSION.post(url, data=body, headers=headers, timeout=timeout)
+
+
+def post_json_body(url, body, timeout):
+    """POST an already-encoded JSON body (bytes) to the Node server."""
+    return post_body(url, body, "application/json", timeout)
+
+
+def post_json(url, payload, timeout):
+    """POST payload to the Node server as JSON, serialized with orjson when installed."""
+    if orjson is not None:
+        body = orjson.dumps(payload, default=_serialize_default)
+    else:
+        body = json.dumps(payload, default=_serialize_default).encode("utf-8")
+    return post_json_body(url, body, timeout)
+
+
+@functools.lru_cache(maxsize=1)
+def local_address():
+    """
+    Our IP on the route to the Node server. Cached for the life of the process
+    (a failed lookup raises and is not cached).
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.connect((SELECTED_NODE_HOST, NODE_PORT))
+        return s.getsockname()[0]
+
 
 def register_client():
     """
@@ -59,10 +255,7 @@ def register_client():
         address = FALLBACK_CLIENT_ADDRESS_OVERRIDE
     else:
         try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect((SELECTED_NODE_HOST, NODE_PORT))
-            address = s.getsockname()[0]
-            s.close()
+            address = local_address()
         except Exception:
             address = ""
     payload = {
@@ -71,7 +264,7 @@ def register_client():
     }
     url = f"{NODE_BASE_URL}/register_client"
     try:
-        resp = requests.post(url, json=payload, timeout=5)
+        resp = post_json(url, payload, timeout=5)
         if resp.status_code == 200:
             print(f"[{datetime.now()}] Registered client '{CLIENT_NAME}' with address '{address}'")
         else:
@@ -82,190 +275,254 @@ def register_client():
 
 # Globals for debouncing `recent_stats`
 latest_recent_stats_payload = None
-recent_stats_debounce_lock = threading.Lock()
-recent_stats_debounce_timer = None
+recent_stats_cv = threading.Condition()
+
+# Large script/stiminfo blobs that the full status sync doesn't send to the server
+STATUS_SYNC_EXCLUDED_TYPES = ('system_script', 'stiminfo', 'loaders_script', 'protocol_script',
+                              'stim_script', 'variants_script')
+
+# Globals for coalescing `copy_status` notifications into one POST
+# Pending payloads are written straight into a '{"rows":[...' request body; a spare buffer
+# is swapped in at flush time and recycled afterwards so bursts reuse the allocation.
+status_buffer = bytearray()
+status_spare_buffer = bytearray()
+status_cv = threading.Condition()
 
 # Debounce duration in seconds
 DEBOUNCE_DURATION = 0.02
 
+# How long the listener waits for a notification before health-checking its connection
+LISTEN_IDLE_CHECK_SECONDS = 5.0
+
 # Queue for inference outbox processing
 inference_outbox_queue = queue.Queue()
 
+# Bounded worker pools for notification handlers (instead of a thread per notification)
+IMAGE_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image")
+TRIAL_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trial")
+
+# Set while a trial outbox run is queued but not yet started; further notifications are
+# covered by that run, so they don't queue another.
+trial_outbox_pending = threading.Event()
+
 
 def process_trial_outbox():
-    conn = None
     BATCH_SIZE = 10
     try:
-        conn = psycopg2.connect(dbname="base", user="postgres", password="postgres", host="localhost")
-        conn.autocommit = True
-
-        while True:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT * FROM outbox_trial ORDER BY base_trial_id ASC LIMIT %s;",
-                    (BATCH_SIZE,)
-                )
-                rows = cur.fetchall()
-
-            if not rows:
-                break
-
-            print(f"[{datetime.now()}] Processing batch of {len(rows)} trials from outbox_trial...")
-            columns = [desc[0] for desc in cur.description]
-            trials = []
-            for row in rows:
-                trial = {
-                    col: (val.isoformat() if isinstance(val, datetime) else val)
-                    for col, val in zip(columns, row)
-                }
-                if USE_OVERRIDE and "host" in trial:
-                    trial["host"] = FALLBACK_CLIENT_ADDRESS_OVERRIDE
-                trials.append(trial)
-
-            node_url = f"{NODE_BASE_URL}/process_outbox_trial"
-            response = requests.post(node_url, json={"rows": trials}, timeout=10)
-
-            if response.status_code == 200:
-                processed_rows = response.json().get("processedRows", [])
-                if processed_rows:
-                    print(f"[{datetime.now()}] Server processed {len(processed_rows)} trials.")
-                    with conn.cursor() as cur:
-                        trial_ids = [r["trial_id"] for r in processed_rows]
-                        cur.execute(
-                            "DELETE FROM outbox_trial WHERE trial_id = ANY(%s);",
-                            (trial_ids,)
-                        )
-                        print(f"[{datetime.now()}] Deleted {cur.rowcount} rows from outbox_trial.")
+        with db_connection() as conn:
+            # Each batch is one transaction: the selected rows stay locked until the
+            # server has confirmed them and we've deleted them, and SKIP LOCKED lets a
+            # concurrent run move on to other rows instead of sending duplicates.
+            conn.autocommit = False
+            while True:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "SELECT * FROM outbox_trial ORDER BY base_trial_id ASC LIMIT %s "
+                        "FOR UPDATE SKIP LOCKED;",
+                        (BATCH_SIZE,)
+                    )
+                    rows = cur.fetchall()
+
+                if not rows:
+                    conn.rollback()
+                    break
+
+                print(f"[{datetime.now()}] Processing batch of {len(rows)} trials from outbox_trial...")
+                columns = [desc[0] for desc in cur.description]
+                trials = []
+                for row in rows:
+                    trial = dict(zip(columns, row))
+                    if USE_OVERRIDE and "host" in trial:
+                        trial["host"] = FALLBACK_CLIENT_ADDRESS_OVERRIDE
+                    trials.append(trial)
+
+                node_url = f"{NODE_BASE_URL}/process_outbox_trial"
+                response = post_json(node_url, {"rows": trials}, timeout=10)
+
+                if response.status_code == 200:
+                    processed_rows = response.json().get("processedRows", [])
+                    if processed_rows:
+                        print(f"[{datetime.now()}] Server processed {len(processed_rows)} trials.")
+                        with conn.cursor() as cur:
+                            trial_ids = [(r["trial_id"],) for r in processed_rows]
+                            execute_values(
+                                cur,
+                                "DELETE FROM outbox_trial WHERE trial_id IN (VALUES %s);",
+                                trial_ids,
+                                page_size=len(trial_ids)
+                            )
+                            print(f"[{datetime.now()}] Deleted {cur.rowcount} rows from outbox_trial.")
+                    else:
+                        print(f"[{datetime.now()}] No trial rows processed for this batch.")
+                    conn.commit()
+                    # Rows the server didn't confirm are still at the head of the outbox;
+                    # looping would just re-select and re-send them. Leave them for the
+                    # next notification instead.
+                    if len(processed_rows) < len(rows):
+                        break
                 else:
-                    print(f"[{datetime.now()}] No trial rows processed for this batch.")
-            else:
-                print(f"[{datetime.now()}] Node server error {response.status_code}: {response.text}")
-                break
+                    print(f"[{datetime.now()}] Node server error {response.status_code}: {response.text}")
+                    conn.rollback()
+                    break
 
-            if len(rows) < BATCH_SIZE:
-                break
+                if len(rows) < BATCH_SIZE:
+                    break
 
     except Exception as e:
         print(f"[{datetime.now()}] process_trial_outbox error: {e}")
-    finally:
-        if conn:
-            conn.close()
+
+
+def _run_trial_outbox():
+    trial_outbox_pending.clear()
+    process_trial_outbox()
+
+
+def schedule_trial_outbox():
+    if trial_outbox_pending.is_set():
+        return
+    trial_outbox_pending.set()
+    TRIAL_POOL.submit(_run_trial_outbox)
 
 
 def process_inference_outbox():
-    conn = None
     BATCH_SIZE = 50
     total_processed = 0
     start_time = datetime.now()
 
     try:
-        conn = psycopg2.connect(dbname="base", user="postgres", password="postgres", host="localhost")
-        conn.autocommit = True
-
-        while True:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT * FROM outbox_inference ORDER BY client_time ASC LIMIT %s;",
-                    (BATCH_SIZE,)
-                )
-                rows = cur.fetchall()
-
-            if not rows:
-                print(f"[{datetime.now()}] No more rows to process in outbox_inference.")
-                break
-
-            print(f"[{datetime.now()}] Processing batch of {len(rows)} rows...")
-            columns = [desc[0] for desc in cur.description]
-            inferences = []
-            for row in rows:
-                inf = {}
-                for col, val in zip(columns, row):
-                    if isinstance(val, datetime):
-                        inf[col] = val.isoformat()
-                    elif isinstance(val, memoryview):
-                        inf[col] = base64.b64encode(bytes(val)).decode('utf-8')
-                    else:
-                        inf[col] = val
-                if USE_OVERRIDE and "host" in inf:
-                    inf["host"] = FALLBACK_CLIENT_ADDRESS_OVERRIDE
-                inferences.append(inf)
+        with db_connection() as conn:
+            # Each batch is popped and sent in one transaction: the DELETE ... RETURNING
+            # both claims the rows (SKIP LOCKED) and removes them, and is only committed
+            # once the server has confirmed every row. Anything else rolls back so the
+            # rows are replayed.
+            conn.autocommit = False
+            b64_columns = None
+            while True:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "WITH popped AS ("
+                        " DELETE FROM outbox_inference WHERE infer_id IN ("
+                        "  SELECT infer_id FROM outbox_inference ORDER BY client_time ASC LIMIT %s"
+                        "  FOR UPDATE SKIP LOCKED"
+                        " ) RETURNING *"
+                        ") SELECT * FROM popped ORDER BY client_time ASC;",
+                        (BATCH_SIZE,)
+                    )
+                    rows = cur.fetchall()
+                    columns = [desc[0] for desc in cur.description]
+                    if b64_columns is None:
+                        # Only bytea columns need work per row, and only on the JSON path;
+                        # msgpack maps buffers straight to its bin type.
+                        b64_columns = [] if INFERENCE_USE_MSGPACK else [
+                            desc[0] for desc in cur.description if desc.type_code == psycopg2.BINARY
+                        ]
+
+                if not rows:
+                    conn.rollback()
+                    print(f"[{datetime.now()}] No more rows to process in outbox_inference.")
+                    break
+
+                print(f"[{datetime.now()}] Processing batch of {len(rows)} rows...")
+                inferences = []
+                for row in rows:
+                    inf = dict(zip(columns, row))
+                    for col in b64_columns:
+                        if inf[col] is not None:
+                            inf[col] = b64encode_str(inf[col])
+                    if USE_OVERRIDE and "host" in inf:
+                        inf["host"] = FALLBACK_CLIENT_ADDRESS_OVERRIDE
+                    inferences.append(inf)
+
+                node_url = f"{NODE_BASE_URL}/process_outbox_inference"
+                print(f"[{datetime.now()}] Sending batch to Node server...")
+                if INFERENCE_USE_MSGPACK:
+                    body = msgpack.packb({"rows": inferences}, use_bin_type=True, default=_serialize_default)
+                    response = post_body(node_url, body, "application/msgpack", timeout=20)
+                else:
+                    response = post_json(node_url, {"rows": inferences}, timeout=20)
 
-            node_url = f"{NODE_BASE_URL}/process_outbox_inference"
-            print(f"[{datetime.now()}] Sending batch to Node server...")
-            response = requests.post(node_url, json={"rows": inferences}, timeout=20)
+                if response.status_code != 200:
+                    conn.rollback()
+                    print(f"[{datetime.now()}] Node server error {response.status_code}: {response.text}")
+                    break
 
-            if response.status_code == 200:
                 processed = response.json().get("processedRows", [])
                 print(f"[{datetime.now()}] Server processed {len(processed)} rows successfully.")
-                if processed:
-                    ids = [r["infer_id"] for r in processed]
-                    with conn.cursor() as cur:
-                        cur.execute(
-                            "DELETE FROM outbox_inference WHERE infer_id = ANY(%s);",
-                            (ids,)
-                        )
-                        total_processed += len(processed)
-                        print(f"[{datetime.now()}] Deleted {len(processed)} rows. Total: {total_processed}")
-            else:
-                print(f"[{datetime.now()}] Node server error {response.status_code}: {response.text}")
-                break
-
-            if len(rows) < BATCH_SIZE:
-                break
-
-        duration = (datetime.now() - start_time).total_seconds()
-        print(f"[{datetime.now()}] Finished inference cycle: {total_processed} rows in {duration:.2f}s")
+                if len(processed) == len(rows):
+                    conn.commit()
+                else:
+                    # The server skipped some rows: undo the pop and delete only the
+                    # confirmed ones, leaving the rest in the outbox.
+                    conn.rollback()
+                    if processed:
+                        ids = [(r["infer_id"],) for r in processed]
+                        with conn.cursor() as cur:
+                            execute_values(
+                                cur,
+                                "DELETE FROM outbox_inference WHERE infer_id IN (VALUES %s);",
+                                ids,
+                                page_size=len(ids)
+                            )
+                        conn.commit()
+                total_processed += len(processed)
+                print(f"[{datetime.now()}] Deleted {len(processed)} rows. Total: {total_processed}")
+
+                if not processed or len(rows) < BATCH_SIZE:
+                    break
+
+            duration = (datetime.now() - start_time).total_seconds()
+            print(f"[{datetime.now()}] Finished inference cycle: {total_processed} rows in {duration:.2f}s")
 
     except Exception as e:
         print(f"[{datetime.now()}] process_inference_outbox error: {e}")
-    finally:
-        if conn:
-            conn.close()
 
 
 def send_entire_status_to_node():
-    conn = psycopg2.connect(dbname="base", user="postgres", password="postgres", host="localhost")
-    conn.autocommit = True
     try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM status WHERE status_type != 'system_script' AND status_type != 'stiminfo' AND status_type != 'stiminfo' AND status_type != 'loaders_script' AND status_type != 'protocol_script' AND status_type != 'stim_script' AND status_type != 'variants_script';")
-            rows = cur.fetchall()
-            if not rows:
-                print("Status table empty, skipping...")
-                return
-            columns = [desc[0] for desc in cur.description]
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                # Only the columns /upsert_status reads; sys_time is never used server-side.
+                cur.execute(
+                    "SELECT host, status_source, status_type, status_value "
+                    "FROM status WHERE status_type NOT IN %s;",
+                    (STATUS_SYNC_EXCLUDED_TYPES,)
+                )
+                rows = cur.fetchall()
+                if not rows:
+                    print("Status table empty, skipping...")
+                    return
+                columns = [desc[0] for desc in cur.description]
 
         statuses = []
         for row in rows:
-            s = {
-                col: (val.isoformat() if isinstance(val, datetime) else val)
-                for col, val in zip(columns, row)
-            }
+            s = dict(zip(columns, row))
             if USE_OVERRIDE and "host" in s:
                 s["host"] = FALLBACK_CLIENT_ADDRESS_OVERRIDE
             statuses.append(s)
 
         node_url = f"{NODE_BASE_URL}/upsert_status"
-        response = requests.post(node_url, json={"rows": statuses}, timeout=5)
+        response = post_json(node_url, {"rows": statuses}, timeout=5)
         if response.status_code != 200:
             print(f"Node server error {response.status_code}: {response.text}")
 
     except Exception as e:
         print(f"[{datetime.now()}] send_entire_status_to_node error: {e}")
-    finally:
-        conn.close()
 
 
-def send_status_to_node(payload):
-    if not payload:
+def send_status_to_node(body):
+    """POST a '{"rows":[...]}' body built from `copy_status` payloads."""
+    if not body:
         return
     try:
-        status_data = json.loads(payload)
-        if USE_OVERRIDE and isinstance(status_data, dict) and "host" in status_data:
-            status_data["host"] = FALLBACK_CLIENT_ADDRESS_OVERRIDE
-
         node_url = f"{NODE_BASE_URL}/upsert_status"
-        response = requests.post(node_url, json={"rows": [status_data]}, timeout=5)
+        if USE_OVERRIDE:
+            rows = loads_json(body)["rows"]
+            for status_data in rows:
+                if isinstance(status_data, dict) and "host" in status_data:
+                    status_data["host"] = FALLBACK_CLIENT_ADDRESS_OVERRIDE
+            response = post_json(node_url, {"rows": rows}, timeout=5)
+        else:
+            response = post_json_body(node_url, bytes(body), timeout=5)
         if response.status_code != 200:
             print(f"Node server error {response.status_code}: {response.text}")
 
@@ -273,23 +530,67 @@ def send_status_to_node(payload):
         print(f"[{datetime.now()}] send_status_to_node error: {e}")
 
 
+def flush_status_to_node():
+    global status_buffer, status_spare_buffer
+    with status_cv:
+        body = status_buffer
+        status_buffer = status_spare_buffer if status_spare_buffer is not None else bytearray()
+        status_spare_buffer = None
+    if body:
+        body += b"]}"
+    send_status_to_node(body)
+    body.clear()
+    with status_cv:
+        status_spare_buffer = body
+
+
+def queue_status(payloads):
+    """Collect `copy_status` payloads for status_worker to flush as one POST."""
+    payloads = [p for p in payloads if p]
+    if not payloads:
+        return
+    with status_cv:
+        was_empty = not status_buffer
+        # Each NOTIFY payload is already a JSON object; append it to the body as-is.
+        for payload in payloads:
+            status_buffer.extend(b"," if status_buffer else b'{"rows":[')
+            status_buffer.extend(payload.encode("utf-8"))
+        if was_empty:
+            status_cv.notify()
+
+
+def status_worker():
+    """
+    Single long-lived flush thread: a burst of `copy_status` payloads goes out as one
+    POST DEBOUNCE_DURATION after its first payload arrived.
+    """
+    while True:
+        with status_cv:
+            status_cv.wait_for(lambda: len(status_buffer) > 0)
+        time.sleep(DEBOUNCE_DURATION)
+        flush_status_to_node()
+
+
 def send_recent_stats_to_node():
     global latest_recent_stats_payload
-    with recent_stats_debounce_lock:
+    with recent_stats_cv:
         payload = latest_recent_stats_payload
         latest_recent_stats_payload = None
 
     if not payload:
         return
     try:
-        recent_stats_data = json.loads(payload)
-        rows = recent_stats_data if isinstance(recent_stats_data, list) else [recent_stats_data]
-        for rec in rows:
-            if USE_OVERRIDE and "host" in rec:
-                rec["host"] = FALLBACK_CLIENT_ADDRESS_OVERRIDE
-
         node_url = f"{NODE_BASE_URL}/upsert_recent_stats"
-        response = requests.post(node_url, json={"rows": rows}, timeout=5)
+        # notify_copy_recent_stats() publishes json_agg() of the whole table, so the
+        # payload is always a JSON array of rows (an empty table sends no payload).
+        if USE_OVERRIDE:
+            rows = loads_json(payload)
+            for rec in rows:
+                if "host" in rec:
+                    rec["host"] = FALLBACK_CLIENT_ADDRESS_OVERRIDE
+            response = post_json(node_url, {"rows": rows}, timeout=5)
+        else:
+            response = post_json_body(node_url, b'{"rows":' + payload.encode("utf-8") + b'}', timeout=5)
         if response.status_code != 200:
             print(f"Node server error {response.status_code}: {response.text}")
 
@@ -298,16 +599,27 @@ def send_recent_stats_to_node():
 
 
 def update_recent_stats(conn, payload):
-    global latest_recent_stats_payload, recent_stats_debounce_timer
-    with recent_stats_debounce_lock:
+    global latest_recent_stats_payload
+    with recent_stats_cv:
         latest_recent_stats_payload = payload
-    if recent_stats_debounce_timer:
-        recent_stats_debounce_timer.cancel()
-    recent_stats_debounce_timer = threading.Timer(DEBOUNCE_DURATION, send_recent_stats_to_node)
-    recent_stats_debounce_timer.start()
+        recent_stats_cv.notify()
+
+
+def recent_stats_worker():
+    """
+    Single long-lived debounce thread: forwards the latest recent_stats snapshot once
+    no newer one has arrived for DEBOUNCE_DURATION.
+    """
+    while True:
+        with recent_stats_cv:
+            recent_stats_cv.wait_for(lambda: latest_recent_stats_payload is not None)
+            while recent_stats_cv.wait(DEBOUNCE_DURATION):
+                pass
+        send_recent_stats_to_node()
 
 
 def periodic_status_sync():
+    pin_db_connection()
     while True:
         try:
             send_entire_status_to_node()
@@ -318,44 +630,36 @@ def periodic_status_sync():
 
 def handle_image_notification(image_type: str):
     print(f"[{datetime.now()}] Processing '{image_type}' notification.")
-    conn = None
     try:
-        conn = psycopg2.connect(dbname="base", user="postgres", password="postgres", host="localhost")
-        conn.autocommit = True
-
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT host, status_source, status_type, status_value "
-                "FROM status WHERE status_type = %s LIMIT 1;",
-                (image_type,)
-            )
-            row = cur.fetchone()
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT host, status_source, status_type, status_value "
+                    "FROM status WHERE status_type = %s LIMIT 1;",
+                    (image_type,)
+                )
+                row = cur.fetchone()
 
         if not row:
             print(f"No '{image_type}' entry found.")
             return
 
         columns = [desc[0] for desc in cur.description]
-        image_data = {
-            col: (val.isoformat() if isinstance(val, datetime) else val)
-            for col, val in zip(columns, row)
-        }
+        image_data = dict(zip(columns, row))
         if USE_OVERRIDE and "host" in image_data:
             image_data["host"] = FALLBACK_CLIENT_ADDRESS_OVERRIDE
 
         node_url = f"{NODE_BASE_URL}/upsert_status"
-        response = requests.post(node_url, json={"rows": [image_data]}, timeout=10)
+        response = post_json(node_url, {"rows": [image_data]}, timeout=10)
         if response.status_code != 200:
             print(f"Node server error {response.status_code}: {response.text}")
 
     except Exception as e:
         print(f"[{datetime.now()}] handle_image_notification error: {e}")
-    finally:
-        if conn:
-            conn.close()
 
 
 def inference_outbox_worker():
+    pin_db_connection()
     consecutive_errors = 0
     while True:
         try:
@@ -376,44 +680,85 @@ def inference_outbox_worker():
             time.sleep(backoff)
 
 
+LISTEN_CHANNELS = ("empty_outbox_trial", "empty_outbox_inference",
+                   "copy_status", "copy_status_oversized",
+                   "copy_recent_stats", "new_image")
+
+
+def open_listen_connection():
+    while True:
+        try:
+            conn = psycopg2.connect(**DB_PARAMS)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                for ch in LISTEN_CHANNELS:
+                    cur.execute(f"LISTEN {ch};")
+            return conn
+        except psycopg2.OperationalError as e:
+            print(f"[{datetime.now()}] Could not open listener connection: {e}; retrying in 5s...")
+            time.sleep(5)
+
+
+def dispatch_notifications(conn):
+    # Take the whole batch at once and dispatch one handler per channel.
+    batch, conn.notifies = conn.notifies, []
+    by_channel = defaultdict(list)
+    for notify in batch:
+        by_channel[notify.channel].append(notify.payload)
+    for channel, payloads in by_channel.items():
+        print(f"[{datetime.now()}] Notification: {channel} x{len(payloads)}, last payload: {payloads[-1]}")
+
+    if "empty_outbox_trial" in by_channel:
+        schedule_trial_outbox()
+    if "empty_outbox_inference" in by_channel:
+        if inference_outbox_queue.qsize() < 100:
+            inference_outbox_queue.put(True)
+        else:
+            print("Inference queue full; skipping.")
+    if "copy_status" in by_channel:
+        queue_status(by_channel["copy_status"])
+    for t in set(by_channel.get("new_image", ())) & {'photo_cartoon', 'screenshot'}:
+        IMAGE_POOL.submit(handle_image_notification, t)
+    if "copy_recent_stats" in by_channel:
+        # Each payload is a full snapshot of recent_stats; only the newest matters.
+        update_recent_stats(conn, by_channel["copy_recent_stats"][-1])
+    # ignore copy_status_oversized
+
+
 def listen():
-    conn = psycopg2.connect(dbname="base", user="postgres", password="postgres", host="localhost")
-    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
-    cur = conn.cursor()
-    for ch in ("empty_outbox_trial", "empty_outbox_inference",
-               "copy_status", "copy_status_oversized",
-               "copy_recent_stats", "new_image"):
-        cur.execute(f"LISTEN {ch};")
+    conn = open_listen_connection()
+    sel = selectors.DefaultSelector()
+    # Register the raw fd: once psycopg2 marks a dead connection closed, conn.fileno()
+    # raises InterfaceError, so unregistering by the connection object would fail.
+    fd = conn.fileno()
+    sel.register(fd, selectors.EVENT_READ)
     print("Now listening for postgres notifications...")
 
     try:
         while True:
-            if select.select([conn], [], []):
+            try:
+                if not sel.select(timeout=LISTEN_IDLE_CHECK_SECONDS):
+                    # Idle: a cheap round trip detects a dead connection instead of
+                    # blocking on it forever. Any notifications it picks up are
+                    # dispatched below.
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1;")
                 conn.poll()
-                while conn.notifies:
-                    notify = conn.notifies.pop(0)
-                    print(f"[{datetime.now()}] Notification: {notify.channel}, payload: {notify.payload}")
-
-                    if notify.channel == "empty_outbox_trial":
-                        threading.Thread(target=process_trial_outbox, daemon=True).start()
-                    elif notify.channel == "empty_outbox_inference":
-                        if inference_outbox_queue.qsize() < 100:
-                            inference_outbox_queue.put(True)
-                        else:
-                            print("Inference queue full; skipping.")
-                    elif notify.channel == "copy_status":
-                        threading.Thread(target=send_status_to_node, args=(notify.payload,), daemon=True).start()
-                    elif notify.channel == "new_image":
-                        t = notify.payload
-                        if t in ('photo_cartoon', 'screenshot'):
-                            threading.Thread(target=handle_image_notification, args=(t,), daemon=True).start()
-                    elif notify.channel == "copy_recent_stats":
-                        threading.Thread(target=update_recent_stats, args=(conn, notify.payload), daemon=True).start()
-                    # ignore copy_status_oversized
+                dispatch_notifications(conn)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                print(f"[{datetime.now()}] Listener connection lost: {e}; reconnecting...")
+                sel.unregister(fd)
+                conn.close()
+                conn = open_listen_connection()
+                fd = conn.fileno()
+                sel.register(fd, selectors.EVENT_READ)
+                # Notifications sent while we were disconnected are gone; drain both outboxes.
+                schedule_trial_outbox()
+                inference_outbox_queue.put(True)
     except KeyboardInterrupt:
         print("\nTerminating listener.")
     finally:
-        cur.close()
+        sel.close()
         conn.close()
         print("Connection closed.")
 
@@ -426,5 +771,7 @@ if __name__ == "__main__":
     print("Initial outbox processing complete.")
     # threading.Thread(target=periodic_status_sync, daemon=True).start()
     threading.Thread(target=inference_outbox_worker, daemon=True).start()
+    threading.Thread(target=recent_stats_worker, daemon=True).start()
+    threading.Thread(target=status_worker, daemon=True).start()
     print(f"[{datetime.now()}] Starting notification listener...")
     listen()
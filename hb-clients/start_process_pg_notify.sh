@@ -1,7 +1,8 @@
 #!/bin/bash
 
 if ! tmux has-session -t process_pg_notify 2>/dev/null; then
-  # Start an interactive bash that runs your script, then drops to a shell
+  # Start an interactive bash that runs your script (restarting it after a crash, since
+  # systemd only supervises this launcher), then drops to a shell once it exits cleanly
   tmux new-session -d -s process_pg_notify \
-    "bash -lc 'python /usr/local/bin/process_pg_notify.py; exec bash'"
+    "bash -lc 'until python /usr/local/bin/process_pg_notify.py; do echo process_pg_notify exited with \$?, restarting in 5s...; sleep 5; done; exec bash'"
 fi
@@ -28,13 +28,16 @@ if command -v apt-get >/dev/null 2>&1; then
     nftables \
     python3 \
     python3-flask \
+    python3-requests \
+    python3-gevent \
+    python3-pydbus \
     iw \
     curl
 else
   echo "Unsupported package manager. Install these packages manually:" >&2
   echo "  - NetworkManager (nmcli)" >&2
   echo "  - nftables (nft)" >&2
-  echo "  - python3 + python3-flask" >&2
+  echo "  - python3 + python3-flask + python3-requests (+ python3-gevent, python3-pydbus, recommended)" >&2
   echo "  - iw, curl" >&2
   exit 2
 fi
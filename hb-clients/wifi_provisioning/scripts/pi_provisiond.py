@@ -12,15 +12,47 @@ Responsibilities:
 
 from __future__ import annotations
 
+# gevent must patch the stdlib before anything else imports socket/threading/subprocess.
+try:
+    from gevent import monkey
+
+    monkey.patch_all()
+except ImportError:  # Fall back to waitress (or Flask's server) on real threads.
+    monkey = None
+
+import fcntl
+import json
 import os
 import pathlib
+import re
+import selectors
+import shlex
+import socket
+import struct
 import subprocess
 import sys
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from operator import itemgetter
+from urllib.parse import urlsplit
+
+import requests
+from flask import Flask, Response, jsonify, request, stream_with_context
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+try:
+    from waitress import serve as waitress_serve
+except ImportError:  # Fall back to Flask's built-in server.
+    waitress_serve = None
 
-from flask import Flask, jsonify, request
+try:
+    from pydbus import SystemBus
+except ImportError:  # Fall back to nmcli for NetworkManager reads.
+    SystemBus = None
 
 
 def log(msg: str) -> None:
@@ -88,6 +120,21 @@ class Config:
         "CHECK_URL", "http://connectivitycheck.gstatic.com/generate_204"
     )
     check_interval_s: float = env_float("CHECK_INTERVAL", 3.0)
+    # While the check keeps failing, the interval doubles up to this cap (reset on success
+    # or when the user hits /connect).
+    check_max_interval_s: float = env_float("CHECK_MAX_INTERVAL", 60.0)
+    # Once online, most checks are a bare TCP connect to CHECK_URL's host (address cached for
+    # CHECK_DNS_TTL seconds); every CHECK_HTTP_EVERY-th check, or any TCP failure, re-runs the
+    # full 204 check. Only the HTTP check can tell a captive portal apart from open internet.
+    check_dns_ttl_s: float = env_float("CHECK_DNS_TTL", 300.0)
+    check_http_every: int = env_int("CHECK_HTTP_EVERY", 10)
+
+    # /scan results are reused for this long; /scan?force=1 always rescans.
+    scan_ttl_s: float = env_float("SCAN_TTL", 10.0)
+
+    # Read NM device state and scan results over D-Bus (needs pydbus). USE_DBUS=0, or pydbus
+    # missing, falls back to parsing nmcli output. Writes always go through nmcli.
+    use_dbus: bool = env_bool("USE_DBUS", True)
     required_successes: int = env_int("REQUIRED_SUCCESSES", 3)
 
     # Behavior:
@@ -127,83 +174,398 @@ state = {
 }
 
 
-def run(cmd: list[str], check: bool = True) -> str:
+# All writes to `state` go through update_state() under state_lock. Readers use
+# state_snapshot, an immutable-by-convention copy replaced wholesale on every change, so they
+# never need the lock or a copy of their own. /events streams wait on state_cv for
+# state_version to move.
+state_lock = threading.Lock()
+state_cv = threading.Condition(state_lock)
+state_version = 0
+state_snapshot: dict = dict(state)
+
+
+def update_state(**changes) -> dict:
+    global state_version, state_snapshot
+    with state_cv:
+        state.update(changes)
+        if state != state_snapshot:
+            state_snapshot = dict(state)
+            state_version += 1
+            state_cv.notify_all()
+        return state_snapshot
+
+
+def run(cmd: list[str], check: bool = True, input: str | None = None) -> str:
     p = subprocess.run(
-        cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        cmd, input=input, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
     )
     if check and p.returncode != 0:
         raise RuntimeError(f"cmd failed ({p.returncode}): {' '.join(cmd)}\n{p.stdout}")
     return p.stdout
 
 
-def run_sh(cmd: str, check: bool = True) -> str:
-    # Used only for nft heredoc convenience; keep usage minimal.
-    p = subprocess.run(
-        cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
-    )
+def run_text(cmd: list[str], check: bool = False) -> str:
+    # For commands whose stdout gets parsed: stderr (warnings, "Error: ..." lines) is kept out
+    # of the parser's input and only surfaces in the exception when check fails.
+    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
     if check and p.returncode != 0:
-        raise RuntimeError(f"cmd failed ({p.returncode}): {cmd}\n{p.stdout}")
+        raise RuntimeError(f"cmd failed ({p.returncode}): {' '.join(cmd)}\n{p.stderr}")
     return p.stdout
 
 
-def iface_exists(ifname: str) -> bool:
-    out = run(["iw", "dev"], check=False)
-    return f"Interface {ifname}" in out
+def run_silent(cmd: list[str], input: str | None = None) -> int:
+    # For fire-and-forget calls: output is discarded unread, only the exit code is returned.
+    return subprocess.run(
+        cmd, input=input, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, text=True
+    ).returncode
+
+
+# Short-lived memo of read-only command output, so back-to-back decisions in one step share a
+# single dump. Call invalidate_cmd_cache() after anything that changes what was cached.
+_CMD_CACHE: dict[tuple[str, ...], tuple[float, str]] = {}
+
+
+def cached_run(cmd: list[str], ttl: float = 1.0) -> str:
+    key = tuple(cmd)
+    hit = _CMD_CACHE.get(key)
+    now = time.monotonic()
+    if hit is not None and now - hit[0] < ttl:
+        return hit[1]
+    out = run_text(cmd)
+    _CMD_CACHE[key] = (now, out)
+    return out
+
+
+def invalidate_cmd_cache() -> None:
+    _CMD_CACHE.clear()
+
+
+NM_BUS_NAME = "org.freedesktop.NetworkManager"
+NM_DEVICE_IFACE = "org.freedesktop.NetworkManager.Device"
+NM_WIRELESS_IFACE = "org.freedesktop.NetworkManager.Device.Wireless"
+NM_AP_IFACE = "org.freedesktop.NetworkManager.AccessPoint"
+
+# NMDeviceType / NMDeviceState values, named the way `nmcli device status` prints them.
+NM_DEVICE_TYPES = {1: "ethernet", 2: "wifi", 5: "bt", 13: "bridge", 14: "generic", 30: "wifi-p2p", 32: "loopback"}
+NM_DEVICE_STATES = {10: "unmanaged", 20: "unavailable", 30: "disconnected", 100: "connected", 110: "deactivating", 120: "failed"}
+
+
+def nm_ap_security(flags: int, wpa: int, rsn: int) -> str:
+    # Approximates nmcli's SECURITY column from the AP's NM80211ApFlags/NM80211ApSecurityFlags.
+    sec = []
+    if flags & 0x1 and not wpa and not rsn:
+        sec.append("WEP")
+    if wpa:
+        sec.append("WPA1")
+    if rsn & 0x300:  # KEY_MGMT_PSK | KEY_MGMT_802_1X
+        sec.append("WPA2")
+    if rsn & 0x400:  # KEY_MGMT_SAE
+        sec.append("WPA3")
+    if (wpa | rsn) & 0x200:
+        sec.append("802.1X")
+    return " ".join(sec)
+
+
+class NmDbus:
+    """
+    Read-only NetworkManager queries over the system bus: typed property reads instead of
+    forking nmcli and parsing its tables. Each object's properties come back in one GetAll.
+    """
+
+    def __init__(self) -> None:
+        self.bus = SystemBus()
+        self.nm = self.bus.get(NM_BUS_NAME)
+
+    def props(self, path: str, iface: str) -> dict:
+        return self.bus.get(NM_BUS_NAME, path)["org.freedesktop.DBus.Properties"].GetAll(iface)
+
+    def devices(self) -> dict[str, tuple[str, str, str]]:
+        devices: dict[str, tuple[str, str, str]] = {}
+        for path in self.nm.GetDevices():
+            p = self.props(path, NM_DEVICE_IFACE)
+            typ = NM_DEVICE_TYPES.get(p["DeviceType"], str(p["DeviceType"]))
+            st = NM_DEVICE_STATES.get(p["State"], "connecting")
+            con = ""
+            if p["ActiveConnection"] != "/":
+                con = self.props(p["ActiveConnection"], "org.freedesktop.NetworkManager.Connection.Active")["Id"]
+            devices[p["Interface"]] = (typ, st, con)
+        return devices
+
+    def wifi_list(self, ifname: str, rescan: str = "auto") -> list[tuple[str, str, int]]:
+        # Same rescan semantics as `nmcli device wifi list --rescan`: auto rescans when the
+        # last scan is over 30s old, yes always does. Returns (ssid, security, signal).
+        dev = self.bus.get(NM_BUS_NAME, self.nm.GetDeviceByIpIface(ifname))[NM_WIRELESS_IFACE]
+        last = dev.LastScan  # ms of CLOCK_BOOTTIME, -1 if never
+        now_ms = time.clock_gettime(time.CLOCK_BOOTTIME) * 1000
+        if rescan == "yes" or (rescan == "auto" and (last < 0 or now_ms - last > 30000)):
+            try:
+                dev.RequestScan({})
+                deadline = time.monotonic() + 15.0
+                while dev.LastScan == last and time.monotonic() < deadline:
+                    time.sleep(0.25)
+            except Exception as e:
+                # NM refuses while a scan is already running or rate-limited; use what it has.
+                log(f"RequestScan on {ifname} failed: {e}")
+        nets = []
+        for path in dev.GetAllAccessPoints():
+            p = self.props(path, NM_AP_IFACE)
+            ssid = bytes(p["Ssid"]).decode("utf-8", errors="replace")
+            nets.append((ssid, nm_ap_security(p["Flags"], p["WpaFlags"], p["RsnFlags"]), int(p["Strength"])))
+        return nets
+
+
+_nm_dbus: NmDbus | None = None
+_nm_dbus_failed = False
+
+
+def get_nm_dbus() -> NmDbus | None:
+    # Connected on first use; None (and nmcli from then on) if disabled or unavailable.
+    global _nm_dbus, _nm_dbus_failed
+    if _nm_dbus is not None or _nm_dbus_failed:
+        return _nm_dbus
+    if not cfg.use_dbus or SystemBus is None:
+        _nm_dbus_failed = True
+        return None
+    try:
+        _nm_dbus = NmDbus()
+    except Exception as e:
+        log(f"NetworkManager D-Bus unavailable ({e}); using nmcli.")
+        _nm_dbus_failed = True
+    return _nm_dbus
+
+
+def nm_devices_nmcli() -> dict[str, tuple[str, str, str]]:
+    out = run_text(["nmcli", "-t", "-f", "DEVICE,TYPE,STATE,CONNECTION", "device", "status"])
+    devices: dict[str, tuple[str, str, str]] = {}
+    for line in out.splitlines():
+        dev, _, rest = line.partition(":")
+        typ, _, rest = rest.partition(":")
+        st, _, con = rest.partition(":")
+        if dev:
+            devices[dev] = (typ, st, con.strip())
+    return devices
+
+
+def nm_devices() -> dict[str, tuple[str, str, str]]:
+    nmd = get_nm_dbus()
+    if nmd is not None:
+        try:
+            return nmd.devices()
+        except Exception as e:
+            log(f"D-Bus device query failed ({e}); falling back to nmcli.")
+    return nm_devices_nmcli()
+
+
+class NmDeviceMirror:
+    """
+    In-process copy of `nmcli device status`. A long-lived `nmcli monitor` marks it stale on
+    any NetworkManager change, so steady-state lookups don't fork nmcli at all. While the
+    monitor isn't running, every lookup queries nmcli directly (the old behavior).
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.devices: dict[str, tuple[str, str, str]] = {}
+        self.dirty = True
+        self.monitoring = False
+
+    def start(self) -> None:
+        threading.Thread(target=self.watch, daemon=True).start()
+
+    def watch(self) -> None:
+        while True:
+            try:
+                p = subprocess.Popen(
+                    ["nmcli", "monitor"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0
+                )
+                # Anything that changed before the monitor attached must be re-read.
+                self.dirty = True
+                self.monitoring = True
+                # The content is never parsed, only "something changed": read raw chunks off the
+                # unbuffered pipe so a burst of events costs one wakeup and no line decoding.
+                # (p.stdout rather than os.read on the fd, so this stays cooperative under gevent.)
+                while p.stdout.read(4096):
+                    self.dirty = True
+                p.wait()
+                log(f"nmcli monitor exited ({p.returncode}); restarting")
+            except OSError as e:
+                log(f"nmcli monitor failed to start: {e}")
+            self.monitoring = False
+            self.dirty = True
+            time.sleep(5.0)
+
+    def get(self) -> dict[str, tuple[str, str, str]]:
+        with self.lock:
+            if self.dirty or not self.monitoring:
+                # Clear first: a change reported while we query re-marks it stale.
+                self.dirty = False
+                self.devices = nm_devices()
+            return self.devices
+
+    def status_text(self) -> str:
+        # Same shape as `nmcli -t -f DEVICE,TYPE,STATE,CONNECTION device status`.
+        return "".join(f"{dev}:{typ}:{st}:{con}\n" for dev, (typ, st, con) in self.get().items())
+
+
+nm_mirror = NmDeviceMirror()
+
+
+# `iw dev` lines that matter, in one pass: "\tInterface ap0", "\t\ttype AP", and the headers
+# that start a stanza not belonging to any named interface ("phy#0", and brcmfmac's
+# "\tUnnamed/non-netdev interface" whose type is P2P-device).
+_IW_DEV_RE = re.compile(r"^\s*(Interface|type|phy#\d+|Unnamed/non-netdev interface)[ \t]*(\S*)", re.M)
+# `iw dev <if> info`: "\tchannel 6 (2437 MHz), width: 20 MHz, center1: 2437 MHz"
+_IW_CHANNEL_RE = re.compile(r"^\s*channel (\d+) \((\d+) MHz\)", re.M)
+
+
+class IwNmSnapshot:
+    """
+    One `iw dev` dump and one view of NM device state (via nm_mirror), each taken lazily on
+    first use and then reused for every lookup. Build a fresh snapshot after anything that
+    adds/removes interfaces or brings NM connections up/down.
+    """
+
+    @cached_property
+    def iw(self) -> dict[str, dict]:
+        ifaces: dict[str, dict] = {}
+        cur = ""
+        for key, val in _IW_DEV_RE.findall(cached_run(["iw", "dev"])):
+            if key == "Interface":
+                cur = val
+                ifaces[cur] = {"type": ""}
+            elif key == "type" and cur:
+                # Only the first type line after an Interface belongs to it.
+                ifaces[cur]["type"] = val
+                cur = ""
+            else:
+                cur = ""
+        return ifaces
+
+    @cached_property
+    def nm(self) -> dict[str, tuple[str, str, str]]:
+        return nm_mirror.get()
+
+    def has_iface(self, ifname: str) -> bool:
+        return ifname in self.iw
+
+    def iface_type(self, ifname: str) -> str:
+        return self.iw.get(ifname, {}).get("type", "")
+
+    def active_con(self, dev: str) -> str:
+        return self.nm.get(dev, ("", "", ""))[2]
+
 
+def iface_exists(ifname: str, snap: IwNmSnapshot | None = None) -> bool:
+    return (snap or IwNmSnapshot()).has_iface(ifname)
 
-def iface_type(ifname: str) -> str:
+
+def iface_type(ifname: str, snap: IwNmSnapshot | None = None) -> str:
     """
     Best-effort parse of `iw dev` to return the interface type (e.g. managed, AP, __ap).
     Returns empty string if unknown/not found.
     """
-    out = run(["iw", "dev"], check=False)
-    lines = out.splitlines()
-    for i, line in enumerate(lines):
-        if line.strip() == f"Interface {ifname}":
-            # look ahead a few lines for the `type ...` stanza
-            for j in range(i + 1, min(i + 12, len(lines))):
-                s = lines[j].strip()
-                if s.startswith("type "):
-                    return s.split(" ", 1)[1].strip()
-            return ""
-    return ""
-
-
-def nm_active_con_for_device(dev: str) -> str:
-    out = run(["nmcli", "-t", "-f", "DEVICE,CONNECTION", "device", "status"], check=False)
-    for line in out.splitlines():
-        if not line.strip():
-            continue
-        device, con = (line.split(":", 1) + [""])[:2]
-        if device == dev:
-            return con.strip()
-    return ""
+    return (snap or IwNmSnapshot()).iface_type(ifname)
+
 
+def nm_active_con_for_device(dev: str, snap: IwNmSnapshot | None = None) -> str:
+    return (snap or IwNmSnapshot()).active_con(dev)
 
-def nm_find_active_ethernet_connection() -> str:
+
+def nm_find_active_ethernet(snap: IwNmSnapshot | None = None) -> tuple[str, str]:
     # Best-effort: pick the active connection for eth0 if present, else any ethernet device.
-    out = run(["nmcli", "-t", "-f", "DEVICE,TYPE,STATE,CONNECTION", "device", "status"], check=False)
+    # Returns (device, connection), or ("", "") if nothing suitable is active.
     eth_candidates: list[tuple[str, str]] = []
-    for line in out.splitlines():
-        parts = (line.split(":", 3) + ["", "", "", ""])[:4]
-        dev, typ, st, con = [p.strip() for p in parts]
+    for dev, (typ, st, con) in (snap or IwNmSnapshot()).nm.items():
         if typ == "ethernet" and st.lower() == "connected" and con and con != "--":
             eth_candidates.append((dev, con))
     for dev, con in eth_candidates:
         if dev == "eth0":
-            return con
-    return eth_candidates[0][1] if eth_candidates else ""
+            return (dev, con)
+    return eth_candidates[0] if eth_candidates else ("", "")
+
+
+def nm_device_for_con(con: str) -> str:
+    # GENERAL.DEVICES is only populated while the connection is active.
+    # An unknown connection prints nothing on stdout (the error goes to stderr).
+    return run_text(["nmcli", "-g", "GENERAL.DEVICES", "connection", "show", con]).strip().partition(",")[0]
+
+
+def nm_apply_con_changes(con: str, dev: str) -> None:
+    """
+    Apply modified connection properties (e.g. ipv4.route-metric) to the active connection.
+    `nmcli device reapply` updates the live config without dropping IPv4; fall back to a
+    down/up bounce if there's no device or NM refuses to reapply.
+    """
+    if dev:
+        try:
+            run(["nmcli", "device", "reapply", dev], check=True)
+            return
+        except RuntimeError as e:
+            log(f"nmcli device reapply {dev} failed; bouncing '{con}' instead: {e}")
+    # Safe even if already down.
+    run_silent(["nmcli", "connection", "down", con])
+    run_silent(["nmcli", "connection", "up", con])
 
 
 def ensure_ip_forwarding() -> None:
-    run(["sysctl", "-w", "net.ipv4.ip_forward=1"], check=False)
-    run(["mkdir", "-p", "/etc/sysctl.d"], check=False)
-    run_sh("bash -lc 'echo net.ipv4.ip_forward=1 > /etc/sysctl.d/99-ipforward.conf'", check=False)
+    try:
+        pathlib.Path("/proc/sys/net/ipv4/ip_forward").write_text("1\n", encoding="utf-8")
+    except OSError as e:
+        log(f"Could not enable ip_forward: {e}")
+    try:
+        p = pathlib.Path("/etc/sysctl.d/99-ipforward.conf")
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text("net.ipv4.ip_forward=1\n", encoding="utf-8")
+    except OSError as e:
+        log(f"Could not persist ip_forward to {p}: {e}")
 
 
-def apply_setup_nft() -> None:
-    # Scoped ruleset: remove only our tables on teardown.
-    rules = f"""
+def read_ipv4_routes() -> str:
+    """
+    IPv4 routing table from /proc/net/route, rendered roughly like `ip route`
+    (e.g. "default via 192.168.1.1 dev wlan0 metric 100"). Falls back to `ip route`.
+    """
+    try:
+        lines = pathlib.Path("/proc/net/route").read_text(encoding="utf-8").splitlines()[1:]
+    except OSError:
+        return run_text(["ip", "route"])
+
+    def ip(hex_le: str) -> str:
+        return socket.inet_ntoa(int(hex_le, 16).to_bytes(4, "little"))
+
+    out: list[str] = []
+    for line in lines:
+        f = line.split()
+        if len(f) < 8:
+            continue
+        iface, dest, gw, flags, metric, mask = f[0], f[1], f[2], int(f[3], 16), f[6], f[7]
+        if not flags & 0x1:  # RTF_UP
+            continue
+        prefix = bin(int(mask, 16)).count("1")
+        r = "default" if prefix == 0 else f"{ip(dest)}/{prefix}"
+        if flags & 0x2:  # RTF_GATEWAY
+            r += f" via {ip(gw)}"
+        r += f" dev {iface}"
+        if metric != "0":
+            r += f" metric {metric}"
+        out.append(r)
+    return "\n".join(out) + "\n"
+
+
+# Deletes our tables in one nft transaction. Each delete is preceded by an (idempotent) add so
+# a missing table doesn't abort the whole batch.
+NFT_TEARDOWN = """
+table ip setupnat
+delete table ip setupnat
+table inet setup
+delete table inet setup
+"""
+
+
+# Scoped ruleset: remove only our tables on teardown. Any previous copy of our tables is
+# replaced in the same transaction, so re-applying never duplicates rules. cfg is frozen, so
+# this is rendered once at import.
+NFT_SETUP_RULES = NFT_TEARDOWN + f"""
 table ip setupnat {{
   chain prerouting {{
     type nat hook prerouting priority -100; policy accept;
@@ -229,34 +591,62 @@ table inet setup {{
   }}
 }}
 """
-    run_sh("nft -f - <<'EOF'\n" + rules + "\nEOF", check=True)
+
+
+NFT_SETUP_FILE = pathlib.Path("/run/pi-provisiond.nft")
+NFT_TEARDOWN_FILE = pathlib.Path("/run/pi-provisiond-teardown.nft")
+
+
+def write_nft_files() -> None:
+    # Written once at bootstrap; nft then loads them by path. Left in /run so the exact
+    # ruleset can be inspected or re-applied by hand with `nft -f`.
+    for path, text in ((NFT_SETUP_FILE, NFT_SETUP_RULES), (NFT_TEARDOWN_FILE, NFT_TEARDOWN)):
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(text)
+        tmp.replace(path)
+
+
+def apply_setup_nft() -> None:
+    run(["nft", "-f", str(NFT_SETUP_FILE)], check=True)
 
 
 def remove_setup_nft() -> None:
-    run(["nft", "delete", "table", "inet", "setup"], check=False)
-    run(["nft", "delete", "table", "ip", "setupnat"], check=False)
+    run_silent(["nft", "-f", str(NFT_TEARDOWN_FILE)])
 
 
 def set_route_metrics_setup_mode() -> None:
     try:
-        wifi_con = cfg.wifi_con_name or nm_active_con_for_device(cfg.wlan_if)
-        eth_con = cfg.eth_con_name or nm_find_active_ethernet_connection()
+        snap = IwNmSnapshot()
+        if cfg.wifi_con_name:
+            wifi_con = cfg.wifi_con_name
+            wifi_dev = nm_device_for_con(wifi_con)
+        else:
+            wifi_con = nm_active_con_for_device(cfg.wlan_if, snap)
+            wifi_dev = cfg.wlan_if
+        if cfg.eth_con_name:
+            eth_con = cfg.eth_con_name
+            eth_dev = nm_device_for_con(eth_con)
+        else:
+            eth_dev, eth_con = nm_find_active_ethernet(snap)
 
         if wifi_con and wifi_con != "--":
-            run(["nmcli", "connection", "modify", wifi_con, "ipv4.route-metric", str(cfg.wifi_metric)], check=False)
+            run_silent(["nmcli", "connection", "modify", wifi_con, "ipv4.route-metric", str(cfg.wifi_metric)])
         if eth_con and eth_con != "--":
-            run(["nmcli", "connection", "modify", eth_con, "ipv4.route-metric", str(cfg.eth_metric)], check=False)
+            run_silent(["nmcli", "connection", "modify", eth_con, "ipv4.route-metric", str(cfg.eth_metric)])
 
-        # Bounce to apply quickly. Safe even if already down.
+        # Apply live so the new metrics take effect without waiting for a reconnect.
         if wifi_con and wifi_con != "--":
-            run(["nmcli", "connection", "down", wifi_con], check=False)
-            run(["nmcli", "connection", "up", wifi_con], check=False)
+            nm_apply_con_changes(wifi_con, wifi_dev)
         if eth_con and eth_con != "--":
-            run(["nmcli", "connection", "down", eth_con], check=False)
-            run(["nmcli", "connection", "up", eth_con], check=False)
+            nm_apply_con_changes(eth_con, eth_dev)
     except Exception as e:
         # Not fatal, but important for captive correctness.
-        state["last_error"] = f"route metrics: {e}"
+        update_state(last_error=f"route metrics: {e}")
+
+
+# `iw dev <wlan> info` is re-probed at most once per window; call _chanband.cache_clear()
+# when the STA may have changed channel.
+CHANBAND_CACHE_S = 30
 
 
 def ap_channel_and_band_from_wlan() -> tuple[str, str]:
@@ -264,21 +654,16 @@ def ap_channel_and_band_from_wlan() -> tuple[str, str]:
     Try to match AP to STA channel/band on single-radio devices.
     Returns (band, channel) where band is 'bg' (2.4GHz) or 'a' (5GHz).
     """
-    out = run(["iw", "dev", cfg.wlan_if, "info"], check=False)
-    ch = ""
-    mhz = 0
-    for line in out.splitlines():
-        s = line.strip()
-        if s.startswith("channel "):
-            # "channel 6 (2437 MHz), width: 20 MHz, center1: 2437 MHz"
-            try:
-                ch = s.split()[1]
-                mhz = int(s.split("(")[1].split()[0])
-            except Exception:
-                pass
-    if not ch:
+    return _chanband(int(time.monotonic()) // CHANBAND_CACHE_S)
+
+
+@lru_cache(maxsize=1)
+def _chanband(bucket: int) -> tuple[str, str]:
+    m = _IW_CHANNEL_RE.search(run_text(["iw", "dev", cfg.wlan_if, "info"]))
+    if not m:
         return ("bg", "6")
-    if mhz >= 4900:
+    ch, mhz = m.groups()
+    if int(mhz) >= 4900:
         return ("a", ch)
     return ("bg", ch)
 
@@ -287,32 +672,72 @@ def wait_for_nm_device(dev: str, timeout_s: float = 3.0) -> None:
     """
     Best-effort wait for NetworkManager to notice a newly created interface.
     Avoids a race where `nmcli connection up` runs before NM has the device.
+    Blocks on `nmcli device monitor` output rather than polling `device status`.
     """
-    deadline = time.time() + timeout_s
-    while time.time() < deadline:
-        out = run(["nmcli", "-t", "-f", "DEVICE", "device", "status"], check=False)
-        if any(line.strip() == dev for line in out.splitlines() if line.strip()):
+    deadline = time.monotonic() + timeout_s
+
+    def present() -> bool:
+        out = run_text(["nmcli", "-t", "-f", "DEVICE", "device", "status"])
+        return any(line.strip() == dev for line in out.splitlines())
+
+    try:
+        mon = subprocess.Popen(
+            ["nmcli", "device", "monitor"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0
+        )
+    except OSError:
+        mon = None
+    try:
+        # Check after the monitor is started so a device appearing in between isn't missed.
+        if present():
             return
-        time.sleep(0.1)
+        if mon is not None:
+            needle = dev.encode() + b":"
+            with selectors.DefaultSelector() as sel:
+                sel.register(mon.stdout, selectors.EVENT_READ)
+                while (remaining := deadline - time.monotonic()) > 0:
+                    if not sel.select(remaining):
+                        return
+                    chunk = os.read(mon.stdout.fileno(), 4096)
+                    if not chunk:
+                        break
+                    # Lines look like "ap0: device created" / "ap0: disconnected".
+                    if needle in chunk:
+                        return
+        # No monitor (or it exited early): poll for whatever time is left.
+        while time.monotonic() < deadline:
+            if present():
+                return
+            time.sleep(0.1)
+    finally:
+        if mon is not None:
+            mon.kill()
+            mon.wait()
 
 
 def ensure_ap_interface() -> None:
     # We require ap_if to be an AP-capable virtual iface. If an iface already exists
     # with the right name but wrong type (common when a previous attempt created it
     # incorrectly), delete and recreate it.
-    if iface_exists(cfg.ap_if):
-        t = iface_type(cfg.ap_if).lower()
+    snap = IwNmSnapshot()
+    if iface_exists(cfg.ap_if, snap):
+        t = iface_type(cfg.ap_if, snap).lower()
         # `iw` usually reports AP ifaces as `AP`. Keep this conservative: if it's not
         # clearly AP-ish, recreate.
         if t and t not in ("ap", "__ap"):
             log(f"Interface {cfg.ap_if} exists but iw reports type={t}; deleting and recreating as __ap")
-            run(["iw", "dev", cfg.ap_if, "del"], check=False)
+            run_silent(["iw", "dev", cfg.ap_if, "del"])
+            invalidate_cmd_cache()
         else:
             return
 
     def _create() -> None:
-        run(["iw", "dev", cfg.wlan_if, "interface", "add", cfg.ap_if, "type", "__ap"], check=True)
-        run(["nmcli", "device", "set", cfg.ap_if, "managed", "yes"], check=False)
+        global _ap_applied
+        _ap_applied = None
+        try:
+            run(["iw", "dev", cfg.wlan_if, "interface", "add", cfg.ap_if, "type", "__ap"], check=True)
+        finally:
+            invalidate_cmd_cache()
+        run_silent(["nmcli", "device", "set", cfg.ap_if, "managed", "yes"])
 
     log(f"Creating AP interface {cfg.ap_if} from {cfg.wlan_if}...")
     try:
@@ -324,10 +749,10 @@ def ensure_ap_interface() -> None:
             f"Failed to create AP interface {cfg.ap_if} from {cfg.wlan_if}: {e}\n"
             f"Retrying once after disconnecting {cfg.wlan_if}..."
         )
-        run(["nmcli", "device", "disconnect", cfg.wlan_if], check=False)
-        run(["ip", "link", "set", cfg.wlan_if, "down"], check=False)
+        run_silent(["nmcli", "device", "disconnect", cfg.wlan_if])
+        run_silent(["ip", "link", "set", cfg.wlan_if, "down"])
         time.sleep(0.5)
-        run(["ip", "link", "set", cfg.wlan_if, "up"], check=False)
+        run_silent(["ip", "link", "set", cfg.wlan_if, "up"])
         time.sleep(0.5)
         _create()
 
@@ -345,48 +770,66 @@ def ensure_ap_interface() -> None:
     wait_for_nm_device(cfg.ap_if, timeout_s=3.0)
 
 
-def ensure_ap_connection() -> None:
-    # Ensure a known connection name exists in NM for the AP.
+# (band, channel) that ensure_ap_connection last applied to the profile. Everything else it
+# sets comes from the frozen cfg, so an unchanged pair means the profile is already correct.
+# Cleared when ensure_ap_interface recreates the AP interface.
+_ap_applied: tuple[str, str] | None = None
+
+
+def ensure_ap_connection() -> bool:
+    # Ensure a known connection name exists in NM for the AP. Returns True if the profile's
+    # band/channel changed (or it was created), i.e. an active AP must be re-activated for the
+    # new settings to take effect.
     #
     # Important: on some systems a stale profile with the same name can exist but be
     # bound to the wrong interface (e.g. eth0). In that case `nmcli connection up`
     # will fail with "No suitable device found ... mismatching interface name".
-    out = run(["nmcli", "-t", "-f", "NAME", "connection", "show"], check=True)
-    have = cfg.ap_con_name in out.splitlines()
+    global _ap_applied
+    if cfg.ap_force_band and cfg.ap_force_channel:
+        band, chan = (cfg.ap_force_band, cfg.ap_force_channel)
+    else:
+        band, chan = ap_channel_and_band_from_wlan()
+    if (band, chan) == _ap_applied:
+        return False
+    if cfg.ap_force_band and cfg.ap_force_channel:
+        log(f"Forcing AP band/channel to {band}/{chan}")
+
+    try:
+        # One query for all properties; fails if the profile doesn't exist.
+        props = run_text(
+            [
+                "nmcli",
+                "-g",
+                "connection.type,connection.interface-name,802-11-wireless.band,802-11-wireless.channel",
+                "connection",
+                "show",
+                cfg.ap_con_name,
+            ],
+            check=True,
+        ).splitlines()
+        have = True
+    except RuntimeError:
+        props = []
+        have = False
+    cur_band_chan = ("", "")
     if have:
-        con_type = run(
-            ["nmcli", "-g", "connection.type", "connection", "show", cfg.ap_con_name],
-            check=False,
-        ).strip()
-        con_if = run(
-            ["nmcli", "-g", "connection.interface-name", "connection", "show", cfg.ap_con_name],
-            check=False,
-        ).strip()
+        con_type, con_if, cur_band, cur_chan = [v.strip() for v in (props + ["", "", "", ""])[:4]]
+        cur_band_chan = (cur_band, cur_chan)
 
         # If the name exists but it's not a Wi-Fi profile, delete and recreate.
         if con_type and con_type != "802-11-wireless":
             log(
                 f"Connection '{cfg.ap_con_name}' exists but has type={con_type}; deleting and recreating as Wi‑Fi AP."
             )
-            run(["nmcli", "connection", "delete", cfg.ap_con_name], check=False)
+            run_silent(["nmcli", "connection", "delete", cfg.ap_con_name])
             have = False
-        else:
-            # Force binding to the AP interface (fixes stale profiles bound to eth0, etc.).
-            if con_if != cfg.ap_if:
-                log(
-                    f"Connection '{cfg.ap_con_name}' is bound to interface '{con_if or '(none)'}'; rebinding to '{cfg.ap_if}'."
-                )
-                run(
-                    [
-                        "nmcli",
-                        "connection",
-                        "modify",
-                        cfg.ap_con_name,
-                        "connection.interface-name",
-                        cfg.ap_if,
-                    ],
-                    check=False,
-                )
+            cur_band_chan = ("", "")
+        elif con_if != cfg.ap_if:
+            # Stale profile bound elsewhere (eth0, etc.). The modify below always sets
+            # connection.interface-name, so the rebind happens there in the same call.
+            log(
+                f"Connection '{cfg.ap_con_name}' is bound to interface '{con_if or '(none)'}'; rebinding to '{cfg.ap_if}'."
+            )
 
     if not have:
         run(
@@ -406,12 +849,6 @@ def ensure_ap_connection() -> None:
             check=True,
         )
 
-    if cfg.ap_force_band and cfg.ap_force_channel:
-        band, chan = (cfg.ap_force_band, cfg.ap_force_channel)
-        log(f"Forcing AP band/channel to {band}/{chan}")
-    else:
-        band, chan = ap_channel_and_band_from_wlan()
-
     base_args = [
         "nmcli",
         "connection",
@@ -464,6 +901,8 @@ def ensure_ap_connection() -> None:
     )
     if "failed to modify 802-11-wireless.channel" in out.lower():
         log(f"WARNING: NM rejected AP channel {chan} (band={band}). Falling back to 2.4GHz ch6.")
+        # nmcli applies a modify all-or-nothing, so the rejected call changed nothing and the
+        # retry has to carry the base properties too.
         run(
             base_args
             + [
@@ -474,15 +913,24 @@ def ensure_ap_connection() -> None:
             ],
             check=True,
         )
+        # Keyed on the requested pair, so the same rejected channel isn't retried next time.
+        _ap_applied = (band, chan)
+        return cur_band_chan != ("bg", "6")
     elif out and "error:" in out.lower():
         raise RuntimeError(f"nmcli modify AP connection failed:\n{out}")
+    _ap_applied = (band, chan)
+    return cur_band_chan != (band, chan)
 
 
 def bring_up_ap() -> None:
     log("Bringing up setup AP via NetworkManager...")
     ensure_ap_interface()
     ensure_ap_connection()
-    run(["nmcli", "connection", "up", cfg.ap_con_name], check=True)
+    try:
+        run(["nmcli", "connection", "up", cfg.ap_con_name], check=True)
+    finally:
+        # iw only reports the AP type once NM has activated the hotspot.
+        invalidate_cmd_cache()
 
     # After activation, confirm interface mode and warn if it's not AP.
     t = iface_type(cfg.ap_if).lower()
@@ -497,20 +945,20 @@ def bring_up_ap() -> None:
         log("WARNING: " + msg)
 
     # Validate AP came up (helps catch driver/capability issues early with a clear error).
-    active = run(["nmcli", "-t", "-f", "NAME,DEVICE", "connection", "show", "--active"], check=False)
+    active = run_text(["nmcli", "-t", "-f", "NAME,DEVICE", "connection", "show", "--active"])
     if f"{cfg.ap_con_name}:{cfg.ap_if}" not in active:
-        diag = "\n".join(
+        # One shell for all the diagnostics rather than a fork per command; sad path only.
+        diag = run(
             [
-                "=== nmcli device status ===",
-                run(["nmcli", "-f", "DEVICE,TYPE,STATE,CONNECTION", "device", "status"], check=False).strip(),
-                "=== nmcli active connections ===",
-                active.strip(),
-                "=== iw dev ===",
-                run(["iw", "dev"], check=False).strip(),
-                "=== ip -4 addr ap_if ===",
-                run(["ip", "-4", "addr", "show", cfg.ap_if], check=False).strip(),
-            ]
-        )
+                "sh",
+                "-c",
+                "echo '=== nmcli device status ==='; nmcli -f DEVICE,TYPE,STATE,CONNECTION device status; "
+                "echo '=== nmcli active connections ==='; nmcli -t -f NAME,DEVICE connection show --active; "
+                "echo '=== iw dev ==='; iw dev; "
+                f"echo '=== ip -4 addr ap_if ==='; ip -4 addr show {shlex.quote(cfg.ap_if)}",
+            ],
+            check=False,
+        ).strip()
         raise RuntimeError(
             f"AP failed to come up (connection '{cfg.ap_con_name}' on '{cfg.ap_if}').\n{diag}\n"
             "Try: `sudo nmcli connection up SetupAP` manually to see the specific NetworkManager error."
@@ -519,11 +967,41 @@ def bring_up_ap() -> None:
 
 
 def bring_down_ap() -> None:
-    run(["nmcli", "connection", "down", cfg.ap_con_name], check=False)
+    run_silent(["nmcli", "connection", "down", cfg.ap_con_name])
 
 
-def scan_wifi() -> list[dict]:
-    out = run(
+# Recent scan results, shared by concurrent/bursty /scan callers. A scan can take ~10s and
+# briefly disturbs ap0, so callers arriving while one is running wait for its result.
+_scan_cache: dict = {"at": 0.0, "data": [], "running": False}
+_scan_cv = threading.Condition()
+
+
+def scan_wifi(force: bool = False) -> list[dict]:
+    with _scan_cv:
+        while True:
+            if not force and _scan_cache["data"] and time.monotonic() - _scan_cache["at"] < cfg.scan_ttl_s:
+                return _scan_cache["data"]
+            if not _scan_cache["running"]:
+                break
+            _scan_cv.wait()
+            # A scan that was already running when we arrived is fresh enough even when forced.
+            force = False
+        _scan_cache["running"] = True
+
+    try:
+        nets = scan_wifi_uncached(rescan="yes" if force else "auto")
+        with _scan_cv:
+            _scan_cache["data"] = nets
+            _scan_cache["at"] = time.monotonic()
+        return nets
+    finally:
+        with _scan_cv:
+            _scan_cache["running"] = False
+            _scan_cv.notify_all()
+
+
+def wifi_list_nmcli(rescan: str = "auto") -> list[tuple[str, str, int]]:
+    out = run_text(
         [
             "nmcli",
             "-t",
@@ -534,40 +1012,47 @@ def scan_wifi() -> list[dict]:
             "list",
             "ifname",
             cfg.wlan_if,
+            "--rescan",
+            rescan,
         ],
-        check=False,
+        check=True,
     )
-    if out.strip().lower().startswith("error:"):
-        raise RuntimeError(out.strip())
-    nets: list[dict] = []
+    nets = []
     for line in out.splitlines():
-        if not line.strip():
-            continue
-        parts = line.split(":", 2)
-        ssid = (parts[0] if len(parts) > 0 else "").strip()
-        sec = (parts[1] if len(parts) > 1 else "").strip()
-        sig = (parts[2] if len(parts) > 2 else "").strip()
-        if ssid:
-            nets.append({"ssid": ssid, "security": sec, "signal": sig})
-
-    # Deduplicate by SSID, keep strongest.
-    best: dict[str, dict] = {}
-    for n in nets:
+        # Split from the right: SECURITY and SIGNAL never contain ':', while `-t` output
+        # escapes any ':' inside the SSID as '\:'.
+        rest, _, sig = line.rpartition(":")
+        ssid, _, sec = rest.rpartition(":")
+        ssid = ssid.strip()
+        if "\\" in ssid:
+            ssid = ssid.replace("\\:", ":").replace("\\\\", "\\")
+        sig = sig.strip()
+        nets.append((ssid, sec.strip(), int(sig) if sig.isdigit() else 0))
+    return nets
+
+
+def scan_wifi_uncached(rescan: str = "auto") -> list[dict]:
+    # rescan=auto lets NM answer from its recent scan list; yes forces a new radio scan.
+    nets = None
+    nmd = get_nm_dbus()
+    if nmd is not None:
         try:
-            s = int(n.get("signal") or 0)
-        except Exception:
-            s = 0
-        if n["ssid"] not in best:
-            best[n["ssid"]] = n
+            nets = nmd.wifi_list(cfg.wlan_if, rescan)
+        except Exception as e:
+            log(f"D-Bus scan failed ({e}); falling back to nmcli.")
+    if nets is None:
+        nets = wifi_list_nmcli(rescan)
+
+    # Deduplicate by SSID, keeping the strongest signal.
+    best: dict[str, tuple[int, dict]] = {}
+    for ssid, sec, sig in nets:
+        if not ssid:
             continue
-        try:
-            prev = int(best[n["ssid"]].get("signal") or 0)
-        except Exception:
-            prev = 0
-        if s > prev:
-            best[n["ssid"]] = n
+        cur = best.get(ssid)
+        if cur is None or sig > cur[0]:
+            best[ssid] = (sig, {"ssid": ssid, "security": sec, "signal": str(sig)})
 
-    return sorted(best.values(), key=lambda x: int(x.get("signal") or 0), reverse=True)
+    return [n for _, n in sorted(best.values(), key=itemgetter(0), reverse=True)]
 
 
 def connect_wifi(ssid: str, password: str) -> str:
@@ -577,9 +1062,82 @@ def connect_wifi(ssid: str, password: str) -> str:
     return run(args, check=True)
 
 
-def check_internet_open() -> tuple[bool, str]:
-    # Bind to wlan0; 204 is canonical "internet open" signal.
-    out = run(
+# Linux values; older Pythons don't expose the constants.
+SO_BINDTODEVICE = getattr(socket, "SO_BINDTODEVICE", 25)
+SIOCGIFADDR = 0x8915
+
+
+def iface_ipv4(ifname: str) -> str:
+    # Primary IPv4 address of an interface via ioctl (no `ip addr` fork); "" if it has none.
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            req = struct.pack("256s", ifname.encode()[:15])
+            return socket.inet_ntoa(fcntl.ioctl(s.fileno(), SIOCGIFADDR, req)[20:24])
+    except OSError:
+        return ""
+
+
+class InterfaceBoundAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose sockets are bound to one interface (the `curl --interface` equivalent):
+    SO_BINDTODEVICE when permitted, else the interface's IPv4 as the source address.
+    """
+
+    def __init__(self, ifname: str, source_ip: str = "", **kwargs) -> None:
+        # Set before super().__init__, which builds the pool manager.
+        self.ifname = ifname
+        self.source_ip = source_ip
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        if self.source_ip:
+            kwargs["source_address"] = (self.source_ip, 0)
+        else:
+            kwargs["socket_options"] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, SO_BINDTODEVICE, self.ifname.encode() + b"\0")
+            ]
+        super().init_poolmanager(*args, **kwargs)
+
+
+# Keep-alive session for the 204-check, built on first use. If SO_BINDTODEVICE isn't
+# permitted (needs CAP_NET_RAW) the session binds to wlan0's current IPv4 instead, and is
+# rebuilt after a failed probe in case the address changed. With neither available we shell
+# out to curl.
+_probe_session: requests.Session | None = None
+_probe_can_bind_device: bool | None = None
+
+
+def get_probe_session() -> requests.Session | None:
+    global _probe_session, _probe_can_bind_device
+    if _probe_session is not None:
+        return _probe_session
+
+    if _probe_can_bind_device is None:
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                s.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, cfg.wlan_if.encode() + b"\0")
+            _probe_can_bind_device = True
+        except OSError as e:
+            log(f"Cannot bind probe sockets to {cfg.wlan_if} ({e}); binding to its IPv4 address instead.")
+            _probe_can_bind_device = False
+
+    source_ip = ""
+    if not _probe_can_bind_device:
+        source_ip = iface_ipv4(cfg.wlan_if)
+        if not source_ip:
+            return None
+
+    sess = requests.Session()
+    sess.trust_env = False
+    adapter = InterfaceBoundAdapter(cfg.wlan_if, source_ip, pool_connections=1, pool_maxsize=1)
+    sess.mount("http://", adapter)
+    sess.mount("https://", adapter)
+    _probe_session = sess
+    return sess
+
+
+def check_internet_open_curl() -> tuple[bool, str]:
+    out = run_text(
         [
             "curl",
             "--interface",
@@ -596,6 +1154,55 @@ def check_internet_open() -> tuple[bool, str]:
     return (out == "204", out)
 
 
+def check_internet_open() -> tuple[bool, str]:
+    # Bind to wlan0; 204 is canonical "internet open" signal.
+    global _probe_session
+    sess = get_probe_session()
+    if sess is None:
+        return check_internet_open_curl()
+    try:
+        # Don't follow redirects: a captive portal's 302 must read as "not open" (same as curl).
+        r = sess.get(cfg.check_url, timeout=2, allow_redirects=False)
+    except requests.RequestException:
+        if not _probe_can_bind_device:
+            # Re-resolve wlan0's address on the next probe.
+            _probe_session = None
+            sess.close()
+        # Mirror curl's "%{http_code}" when no response was received.
+        return (False, "000")
+    return (r.status_code == 204, str(r.status_code))
+
+
+_check_addr: tuple[float, tuple] = (0.0, ())
+
+
+def check_internet_tcp(timeout: float = 1.5) -> bool:
+    """Cheap liveness probe: can wlan0 still open a TCP connection to the check host?"""
+    global _check_addr
+    at, addr = _check_addr
+    try:
+        if not addr or time.monotonic() - at >= cfg.check_dns_ttl_s:
+            u = urlsplit(cfg.check_url)
+            port = u.port or (443 if u.scheme == "https" else 80)
+            addr = socket.getaddrinfo(u.hostname, port, socket.AF_INET, socket.SOCK_STREAM)[0][4]
+            _check_addr = (time.monotonic(), addr)
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            if _probe_can_bind_device:
+                s.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, cfg.wlan_if.encode() + b"\0")
+            else:
+                ip = iface_ipv4(cfg.wlan_if)
+                if not ip:
+                    return False
+                s.bind((ip, 0))
+            s.settimeout(timeout)
+            s.connect(addr)
+        return True
+    except OSError:
+        # Re-resolve next time in case the address went stale.
+        _check_addr = (0.0, ())
+        return False
+
+
 def write_provisioned_marker() -> None:
     try:
         p = pathlib.Path(cfg.provisioned_marker)
@@ -612,44 +1219,79 @@ def is_provisioned() -> bool:
         return False
 
 
+# Set by /connect so the monitor re-checks connectivity immediately instead of sleeping out
+# its current interval (or, after teardown, instead of staying parked indefinitely).
+wake = threading.Event()
+
+# Once online, the 204-check interval doubles after each success up to this cap.
+ONLINE_MAX_CHECK_INTERVAL_S = 300.0
+
+
 def monitor_loop() -> None:
-    state["mode"] = "setup"
+    update_state(mode="setup")
+    delay = cfg.check_interval_s
+    torn_down = False
+    online_checks = 0
     while True:
+        if torn_down:
+            # AP + nftables are gone and we're staying resident: nothing to poll until the
+            # user asks for a new connection.
+            wake.wait()
+            wake.clear()
+            torn_down = False
+            delay = cfg.check_interval_s
+
         try:
-            if not state.get("check_armed", True):
-                state["internet_open"] = False
-                state["last_internet_check_http_code"] = ""
-                state["success_streak"] = 0
-                time.sleep(cfg.check_interval_s)
-                continue
-
-            ok, code = check_internet_open()
-            state["internet_open"] = ok
-            state["last_internet_check_http_code"] = code
-            state["success_streak"] = state["success_streak"] + 1 if ok else 0
-
-            if ok and state["success_streak"] >= cfg.required_successes:
-                if state["mode"] != "online":
-                    state["mode"] = "online"
-                    write_provisioned_marker()
-                    if cfg.auto_teardown:
-                        bring_down_ap()
-                        remove_setup_nft()
-                if cfg.exit_on_online:
-                    os._exit(0)
+            if not state_snapshot.get("check_armed", True):
+                update_state(internet_open=False, last_internet_check_http_code="", success_streak=0)
+                delay = cfg.check_interval_s
             else:
-                if state["mode"] != "provisioning":
-                    state["mode"] = "setup"
+                ok = False
+                if state_snapshot["mode"] == "online" and _probe_can_bind_device is not None:
+                    online_checks += 1
+                    if online_checks % max(1, cfg.check_http_every):
+                        ok = check_internet_tcp()
+                        code = state_snapshot["last_internet_check_http_code"]
+                else:
+                    online_checks = 0
+                if not ok:
+                    ok, code = check_internet_open()
+                # monitor_loop is the only writer of success_streak, so read-then-write is safe.
+                snap = update_state(
+                    internet_open=ok,
+                    last_internet_check_http_code=code,
+                    success_streak=state_snapshot["success_streak"] + 1 if ok else 0,
+                )
+
+                if ok and snap["success_streak"] >= cfg.required_successes:
+                    if snap["mode"] != "online":
+                        update_state(mode="online")
+                        write_provisioned_marker()
+                        if cfg.auto_teardown:
+                            bring_down_ap()
+                            remove_setup_nft()
+                            torn_down = True
+                    if cfg.exit_on_online:
+                        os._exit(0)
+                    delay = min(ONLINE_MAX_CHECK_INTERVAL_S, delay * 2)
+                else:
+                    if snap["mode"] != "provisioning":
+                        update_state(mode="setup")
+                    delay = cfg.check_interval_s if ok else min(cfg.check_max_interval_s, delay * 2)
         except Exception as e:
-            state["last_error"] = str(e)
-            state["mode"] = "error"
+            update_state(last_error=str(e), mode="error")
+            delay = cfg.check_interval_s
 
-        time.sleep(cfg.check_interval_s)
+        if torn_down:
+            continue
+        if wake.wait(delay):
+            # A fresh /connect: start over at the base interval.
+            wake.clear()
+            delay = cfg.check_interval_s
 
 
-@app.get("/")
-def index():
-    return f"""<!doctype html>
+# cfg is frozen, so the page is rendered once; captive probe storms just re-send the bytes.
+INDEX_HTML = f"""<!doctype html>
 <html>
 <head>
   <meta name="viewport" content="width=device-width, initial-scale=1">
@@ -688,9 +1330,7 @@ def index():
   <script>
     async function refresh() {{
       const r = await fetch('/status');
-      const j = await r.json();
-      document.getElementById('st').textContent =
-        `${{j.mode}} | internet_open=${{j.internet_open}} | streak=${{j.success_streak}} | last_code=${{j.last_internet_check_http_code}}`;
+      show(await r.json());
     }}
     async function scan() {{
       const outEl = document.getElementById('out');
@@ -728,12 +1368,25 @@ def index():
       const j = await r.json();
       document.getElementById('out').textContent = JSON.stringify(j, null, 2);
     }}
-    setInterval(refresh, 2000);
+    function show(j) {{
+      document.getElementById('st').textContent =
+        `${{j.mode}} | internet_open=${{j.internet_open}} | streak=${{j.success_streak}} | last_code=${{j.last_internet_check_http_code}}`;
+    }}
+    if (window.EventSource) {{
+      new EventSource('/events').onmessage = (ev) => show(JSON.parse(ev.data));
+    }} else {{
+      setInterval(refresh, 2000);
+    }}
     refresh();
   </script>
 </body>
 </html>
-"""
+""".encode("utf-8")
+
+
+@app.get("/")
+def index():
+    return Response(INDEX_HTML, mimetype="text/html")
 
 
 @app.get("/generate_204")
@@ -751,10 +1404,14 @@ def apple_hotspot_detect():
 
 @app.get("/scan")
 def api_scan():
+    # ?limit=N caps the reply to the N strongest networks (default 30) to keep the JSON small
+    # over the setup AP. The cached list is already sorted, so this is a slice.
+    limit = request.args.get("limit", "30")
+    limit = int(limit) if limit.isdigit() else 30
     try:
-        return jsonify(scan_wifi())
+        return jsonify(scan_wifi(force=request.args.get("force") == "1")[:limit])
     except Exception as e:
-        state["last_error"] = str(e)
+        update_state(last_error=str(e))
         return jsonify({"status": "error", "error": str(e)}), 500
 
 
@@ -767,22 +1424,28 @@ def api_connect():
         return jsonify({"status": "error", "error": "missing ssid"}), 400
 
     try:
-        state["mode"] = "provisioning"
+        update_state(mode="provisioning")
         out = connect_wifi(ssid, password)
 
-        # Once the user explicitly connects, arm the 204-check so we can detect portal clearance.
-        state["check_armed"] = True
-
-        # After connecting, re-tune AP channel/band to match STA, then bounce AP.
-        ensure_ap_connection()
-        run(["nmcli", "connection", "down", cfg.ap_con_name], check=False)
-        run(["nmcli", "connection", "up", cfg.ap_con_name], check=False)
-
-        state["mode"] = "setup"
+        # Once the user explicitly connects, arm the 204-check so we can detect portal clearance,
+        # and have the monitor re-check now rather than after its current interval.
+        update_state(check_armed=True)
+        wake.set()
+
+        # After connecting, re-tune AP channel/band to match STA, then bounce AP. The STA may
+        # have just moved channel, so don't reuse a cached reading. Skip the bounce (and the
+        # ~3s outage for setup clients) when band/channel didn't change.
+        _chanband.cache_clear()
+        if ensure_ap_connection():
+            run_silent(["nmcli", "connection", "down", cfg.ap_con_name])
+            run_silent(["nmcli", "connection", "up", cfg.ap_con_name])
+        elif nm_active_con_for_device(cfg.ap_if) != cfg.ap_con_name:
+            run_silent(["nmcli", "connection", "up", cfg.ap_con_name])
+
+        update_state(mode="setup")
         return jsonify({"status": "ok", "nmcli": out})
     except Exception as e:
-        state["last_error"] = str(e)
-        state["mode"] = "error"
+        update_state(last_error=str(e), mode="error")
         return jsonify({"status": "error", "error": str(e)}), 500
 
 
@@ -792,15 +1455,33 @@ def api_internet():
     return jsonify({"internet_open": ok, "http_code": code})
 
 
+@app.get("/events")
+def api_events():
+    # Server-sent events: push `state` whenever it changes, with a comment line as a
+    # keepalive so proxies don't time the stream out.
+    def gen():
+        seen = -1
+        while True:
+            with state_cv:
+                changed = state_cv.wait_for(lambda: state_version != seen, timeout=15.0)
+                seen = state_version
+                snap = state_snapshot
+            yield f"data: {json.dumps(snap)}\n\n" if changed else ": keepalive\n\n"
+
+    return Response(
+        stream_with_context(gen()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/status")
 def api_status():
-    routes = run(["ip", "route"], check=False)
-    devs = run(["nmcli", "-t", "-f", "DEVICE,TYPE,STATE,CONNECTION", "device", "status"], check=False)
-    return jsonify(
+    # In-memory only, so UI polling and captive clients never cost a syscall or nmcli fork.
+    # Route/device dumps live on /diagnostics.
+    resp = jsonify(
         {
-            **state,
-            "routes": routes,
-            "devices": devs,
+            **state_snapshot,
             "wlan_if": cfg.wlan_if,
             "ap_if": cfg.ap_if,
             "setup_ssid": cfg.setup_ssid,
@@ -808,14 +1489,22 @@ def api_status():
             "check_url": cfg.check_url,
         }
     )
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+@app.get("/diagnostics")
+def api_diagnostics():
+    resp = jsonify({"routes": read_ipv4_routes(), "devices": nm_mirror.status_text()})
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
 
 
 def bootstrap() -> None:
     # If we've already provisioned successfully in the past, don't re-enter setup mode
     # (unless explicitly forced). This prevents the AP from flapping on every boot.
     if cfg.skip_if_provisioned and not cfg.force_setup and is_provisioned():
-        state["mode"] = "online"
-        state["internet_open"] = True
+        update_state(mode="online", internet_open=True)
         log(
             f"Provisioned marker found at {cfg.provisioned_marker}; skipping setup AP. "
             "(Set FORCE_SETUP=1 or delete the marker to re-enter setup.)"
@@ -824,26 +1513,45 @@ def bootstrap() -> None:
         sys.exit(0)
 
     log("Bootstrapping setup mode...")
-    state["check_armed"] = not cfg.arm_check_on_connect
-    ensure_ip_forwarding()
-    set_route_metrics_setup_mode()
-    bring_up_ap()
-    apply_setup_nft()
+    update_state(check_armed=not cfg.arm_check_on_connect)
+    write_nft_files()
+    # nft matches interfaces by name, so the ruleset can be loaded while NM is still busy with
+    # route metrics and the AP. Don't leave it behind if the AP never comes up.
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        nft = ex.submit(apply_setup_nft)
+        try:
+            ensure_ip_forwarding()
+            set_route_metrics_setup_mode()
+            bring_up_ap()
+        except Exception:
+            if nft.exception() is None:
+                remove_setup_nft()
+            raise
+        nft.result()
     log("Setup mode initialized (AP + nftables).")
 
 
 def main() -> None:
     bootstrap()
+    nm_mirror.start()
     t = threading.Thread(target=monitor_loop, daemon=True)
     t.start()
-    app.run(host="0.0.0.0", port=cfg.http_port)
-
+    # /scan and /connect can block on nmcli for ~10s and each open /events stream stays open
+    # indefinitely. Under gevent those waits just park a greenlet; otherwise use a thread pool
+    # so captive-probe redirects aren't queued behind them.
+    if monkey is not None:
+        from gevent.pywsgi import WSGIServer
+
+        WSGIServer(("0.0.0.0", cfg.http_port), app).serve_forever()
+    elif waitress_serve is not None:
+        waitress_serve(app, host="0.0.0.0", port=cfg.http_port, threads=16)
+    else:
+        app.run(host="0.0.0.0", port=cfg.http_port, threaded=True)
 
 if __name__ == "__main__":
     try:
         main()
     except Exception as e:
-        state["last_error"] = str(e)
-        state["mode"] = "error"
+        update_state(last_error=str(e), mode="error")
         raise
 
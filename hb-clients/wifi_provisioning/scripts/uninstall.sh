@@ -38,6 +38,7 @@ systemctl daemon-reload
 echo "[pi-provisiond] Removing nftables setup tables (best effort)..."
 nft delete table inet setup 2>/dev/null || true
 nft delete table ip setupnat 2>/dev/null || true
+rm -f /run/pi-provisiond.nft /run/pi-provisiond-teardown.nft
 
 echo "[pi-provisiond] Done."
 
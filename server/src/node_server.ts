@@ -1,8 +1,11 @@
 import express, { Request, Response } from "express";
 import { Pool } from "pg";
+import { decode as decodeMsgpack } from "@msgpack/msgpack";
 
 const app = express();
 app.use(express.json({ limit: "10mb" })); // Adjust the limit as needed
+// process_pg_notify.py sends outbox_inference batches as MessagePack (binary input_data).
+app.use(express.raw({ type: "application/msgpack", limit: "10mb" }));
 
 // Database configuration
 const dbConfig = {
@@ -445,7 +448,14 @@ app.post("/process_outbox_trial", async (req: Request, res: Response) => {
 });
 
 app.post("/process_outbox_inference", async (req: Request, res: Response) => {
-  const rows = req.body.rows;
+  let rows;
+  try {
+    const body: any = req.is("application/msgpack") ? decodeMsgpack(req.body) : req.body;
+    rows = body?.rows;
+  } catch (decodeError) {
+    console.error("Error decoding msgpack /process_outbox_inference payload:", decodeError);
+    return res.status(400).send({ error: "Invalid msgpack payload." });
+  }
   console.log("Received process_outbox_inference payload");
 
   if (!Array.isArray(rows)) {
@@ -480,6 +490,9 @@ app.post("/process_outbox_inference", async (req: Request, res: Response) => {
       for (let i = 0; i < rows.length; i++) {
         const row = rows[i];
         const savepointName = `savepoint_row_${i}`;
+        // Row without its (possibly large, binary) payload, for logs and skippedRows.
+        const rowMeta = { ...row };
+        delete rowMeta.input_data;
         
         const {
           infer_id,
@@ -488,7 +501,7 @@ app.post("/process_outbox_inference", async (req: Request, res: Response) => {
           host,
           infer_label,
           manual_label,
-          input_data, // Expected to be Base64 string if present
+          input_data, // Base64 string (JSON) or raw bytes (msgpack) if present
           mime_type,
           client_time,
           confidence,
@@ -504,9 +517,9 @@ app.post("/process_outbox_inference", async (req: Request, res: Response) => {
         ) {
           console.warn(
             `Skipping invalid inference row (pre-check: required fields missing or invalid), row index ${i}:`,
-            JSON.stringify(row, null, 2)
+            JSON.stringify(rowMeta, null, 2)
           );
-          skippedRows.push({index: i, rowData: row, error: "Pre-check validation failed"});
+          skippedRows.push({index: i, rowData: rowMeta, error: "Pre-check validation failed"});
           continue;
         }
 
@@ -517,18 +530,20 @@ app.post("/process_outbox_inference", async (req: Request, res: Response) => {
           } catch (bufferError) {
             console.warn(
               `Skipping invalid inference row (input_data base64 decoding error), row index ${i}:`,
-              JSON.stringify(row, null, 2),
+              JSON.stringify(rowMeta, null, 2),
               bufferError
             );
-            skippedRows.push({index: i, rowData: row, error: "Base64 decoding error", details: bufferError});
+            skippedRows.push({index: i, rowData: rowMeta, error: "Base64 decoding error", details: bufferError});
             continue;
           }
+        } else if (input_data instanceof Uint8Array) {
+          inputDataBuffer = Buffer.from(input_data.buffer, input_data.byteOffset, input_data.byteLength);
         } else if (input_data && typeof input_data !== 'string') {
              console.warn(
               `Skipping invalid inference row (input_data is not a string), row index ${i}:`,
-              JSON.stringify(row, null, 2)
+              JSON.stringify(rowMeta, null, 2)
             );
-            skippedRows.push({index: i, rowData: row, error: "input_data not a string"});
+            skippedRows.push({index: i, rowData: rowMeta, error: "input_data not a string"});
             continue;
         }
 
@@ -554,11 +569,11 @@ app.post("/process_outbox_inference", async (req: Request, res: Response) => {
             await client.query(`ROLLBACK TO SAVEPOINT ${savepointName}`);
             console.error(
               `Error inserting row (rolled back to ${savepointName}), row index ${i}, skipping row:`,
-              JSON.stringify(row, null, 2),
+              JSON.stringify(rowMeta, null, 2),
               queryError.message || queryError,
               queryError.code ? `SQLState: ${queryError.code}` : ''
             );
-            skippedRows.push({index: i, rowData: row, error: queryError.message, sqlState: queryError.code});
+            skippedRows.push({index: i, rowData: rowMeta, error: queryError.message, sqlState: queryError.code});
         }
       }
 
@@ -568,7 +583,8 @@ app.post("/process_outbox_inference", async (req: Request, res: Response) => {
         message: `${processedRows.length} rows processed into server_inference, ${skippedRows.length} rows skipped.`,
         processedRowsCount: processedRows.length,
         skippedRowsCount: skippedRows.length,
-        processedRows,
+        // The client only needs infer_id back; don't echo the binary payload.
+        processedRows: processedRows.map(({ input_data, ...rest }) => rest),
         skippedRows,
       });
     } catch (err: unknown) {
@@ -3,6 +3,8 @@ Sample client for server/src/user_db_interface.ts
 
 Dependencies:
     pip install pandas requests
+    pip install orjson  # optional, faster trialinfo decoding
+    pip install httpx   # optional, fetches windows on one asyncio loop instead of threads
 
 This script calls the Express GET /query endpoint exposed by user_db_interface.ts
 and reproduces the intent of the SQL example:
@@ -21,11 +23,26 @@ from __future__ import annotations
 
 import os
 import json
-from typing import Any, Dict, List, Optional
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime, timedelta, date
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib decoder.
+    orjson = None
+
+try:
+    import httpx
+except ImportError:  # Fall back to a requests thread pool.
+    httpx = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
 
 
 # ----------------------
@@ -45,26 +62,31 @@ END_DATE = os.environ.get("HB_END_DATE", "2025-09-01")
 SUBJECTS = os.environ.get("HB_SUBJECTS", "momo,riker")  # comma-separated for multi-value
 STATE_SYSTEM = os.environ.get("HB_STATE_SYSTEM", "planko")
 
+# Optional comma-separated stiminfo keys. When set, those columns are built directly instead
+# of letting json_normalize discover the schema (nested keys are not flattened).
+STIMINFO_KEYS = [k.strip() for k in os.environ.get("HB_STIMINFO_KEYS", "").split(",") if k.strip()]
+
+# Number of time windows fetched concurrently
+PARALLEL = max(1, int(os.environ.get("HB_PARALLEL", "4")))
+
+# One pooled session shared by all fetch workers (thread-pool path, without httpx)
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+
 
 def _ensure_dict(value: Any) -> Dict[str, Any]:
     """Coerce arbitrary input into a dict (best-effort)."""
     if isinstance(value, dict):
         return value
-    if value is None or (isinstance(value, float) and pd.isna(value)):
-        return {}
-    if isinstance(value, (bytes, bytearray)):
+    if isinstance(value, (str, bytes, bytearray)):
+        # orjson takes str/bytes directly and tolerates surrounding whitespace.
         try:
-            value = value.decode("utf-8", errors="ignore")
-        except Exception:
-            return {}
-    if isinstance(value, str):
-        text = value.strip()
-        if text == "":
-            return {}
-        try:
-            return json.loads(text)
+            parsed = _json_loads(value)
         except Exception:
             return {}
+        return parsed if isinstance(parsed, dict) else {}
     return {}
 
 
@@ -81,7 +103,7 @@ def _format_ts(d: datetime) -> str:
     return d.strftime("%Y-%m-%d %H:%M:%S")
 
 
-def _fetch_rows_window(start_ts: str, end_ts: str, extra: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+def _window_params(start_ts: str, end_ts: str, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
     params = {
         "user": DB_USER,
         "pass": DB_PASS,
@@ -93,8 +115,11 @@ def _fetch_rows_window(start_ts: str, end_ts: str, extra: Optional[Dict[str, str
     }
     if extra:
         params.update(extra)
+    return params
 
-    resp = requests.get(BASE_URL, params=params, timeout=180)
+
+def _rows_from_response(resp: Any) -> List[Dict[str, Any]]:
+    # Works on both requests and httpx responses (status_code / json() / text).
     if resp.status_code == 200:
         data = resp.json()
         if not isinstance(data, list):
@@ -114,58 +139,112 @@ def _fetch_rows_window(start_ts: str, end_ts: str, extra: Optional[Dict[str, str
     raise SystemExit(f"HTTP {resp.status_code}: {body_json}")
 
 
-def fetch_all_rows_chunked() -> List[Dict[str, Any]]:
-    start_date = _parse_date(START_DATE)
-    end_date = _parse_date(END_DATE)
+def _fetch_rows_window(start_ts: str, end_ts: str, extra: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+    resp = _session.get(BASE_URL, params=_window_params(start_ts, end_ts, extra), timeout=180)
+    return _rows_from_response(resp)
 
-    window_days = max(1, int(os.environ.get("HB_WINDOW_DAYS", "7")))
+
+Window = Tuple[datetime, datetime]
+
+
+def _windows(start: datetime, end: datetime, step: timedelta) -> List[Window]:
+    out: List[Window] = []
+    curr = start
+    while curr < end:
+        window_end = min(curr + step, end)
+        out.append((curr, window_end))
+        curr = window_end
+    return out
+
+
+def _split_window(start: datetime, end: datetime) -> Optional[List[Window]]:
+    # Halve day windows down to HB_MIN_WINDOW_DAYS, then split into HB_WINDOW_HOURS
+    # pieces, halving down to one hour. None means the window cannot shrink further.
     min_window_days = max(1, int(os.environ.get("HB_MIN_WINDOW_DAYS", "1")))
+    span = end - start
+    if span > timedelta(days=min_window_days):
+        step = timedelta(days=max(min_window_days, span.days // 2))
+    elif span > timedelta(hours=1):
+        hours = span // timedelta(hours=1)
+        step_hours = max(1, int(os.environ.get("HB_WINDOW_HOURS", "6")))
+        step = timedelta(hours=max(1, min(step_hours, hours // 2)))
+    else:
+        return None
+    return _windows(start, end, step)
 
-    all_rows: List[Dict[str, Any]] = []
-    curr = start_date
-    while curr < end_date:
-        window_end = min(curr + timedelta(days=window_days), end_date)
-        start_ts = f"{curr.isoformat()} 00:00:00"
-        end_ts = f"{window_end.isoformat()} 00:00:00"
-        try:
-            part = _fetch_rows_window(start_ts, end_ts)
-            all_rows.extend(part)
-            curr = window_end
-        except TooLargeError:
-            if window_days > min_window_days:
-                # Halve the window and retry
-                window_days = max(min_window_days, window_days // 2)
-                continue
-            # Day window still too large; attempt sub-day splits
-            if not _fetch_subday(curr, min(window_end, end_date), all_rows):
-                raise SystemExit(
-                    "A single-day window still exceeds limits; consider narrowing filters (subjects, project, protocol, variant)."
-                )
-            curr = window_end
 
-    return all_rows
+_TOO_LARGE_MSG = (
+    "A one-hour window still exceeds limits; consider narrowing filters (subjects, project, protocol, variant)."
+)
 
 
-def _fetch_subday(day_start: date, day_end: date, sink: List[Dict[str, Any]]) -> bool:
-    # Split within [day_start, day_end) into hourly windows, adaptively halving if needed
-    start_dt = datetime.combine(day_start, datetime.min.time())
-    end_dt = datetime.combine(day_end, datetime.min.time())
-    step_hours = max(1, int(os.environ.get("HB_WINDOW_HOURS", "6")))
-    min_hours = 1
+def _fetch_windows_threaded(windows: List[Window]) -> Dict[datetime, List[Dict[str, Any]]]:
+    results: Dict[datetime, List[Dict[str, Any]]] = {}
+    ex = ThreadPoolExecutor(max_workers=PARALLEL)
+    try:
+        pending = {ex.submit(_fetch_rows_window, _format_ts(s), _format_ts(e)): (s, e) for s, e in windows}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                s, e = pending.pop(fut)
+                try:
+                    results[s] = fut.result()
+                except TooLargeError:
+                    parts = _split_window(s, e)
+                    if parts is None:
+                        raise SystemExit(_TOO_LARGE_MSG)
+                    for ps, pe in parts:
+                        pending[ex.submit(_fetch_rows_window, _format_ts(ps), _format_ts(pe))] = (ps, pe)
+    except BaseException:
+        # Any fatal window (SystemExit from a bad response, Ctrl-C, ...): drop the queued
+        # windows instead of letting the executor run them all before we can exit.
+        ex.shutdown(wait=False, cancel_futures=True)
+        raise
+    ex.shutdown()
+    return results
+
+
+async def _fetch_windows_async(windows: List[Window]) -> Dict[datetime, List[Dict[str, Any]]]:
+    results: Dict[datetime, List[Dict[str, Any]]] = {}
+    sem = asyncio.Semaphore(PARALLEL)
+    limits = httpx.Limits(max_connections=8, max_keepalive_connections=8)
+    async with httpx.AsyncClient(timeout=180, limits=limits) as client:
+
+        async def fetch(s: datetime, e: datetime) -> None:
+            async with sem:
+                resp = await client.get(BASE_URL, params=_window_params(_format_ts(s), _format_ts(e)))
+            try:
+                results[s] = _rows_from_response(resp)
+            except TooLargeError:
+                parts = _split_window(s, e)
+                if parts is None:
+                    raise SystemExit(_TOO_LARGE_MSG)
+                await asyncio.gather(*(fetch(ps, pe) for ps, pe in parts))
+
+        # The first failure propagates; asyncio.run() then cancels the sibling fetches.
+        await asyncio.gather(*(fetch(s, e) for s, e in windows))
+    return results
 
-    curr = start_dt
-    while curr < end_dt:
-        window_end = min(curr + timedelta(hours=step_hours), end_dt)
-        try:
-            part = _fetch_rows_window(_format_ts(curr), _format_ts(window_end))
-            sink.extend(part)
-            curr = window_end
-        except TooLargeError:
-            if step_hours > min_hours:
-                step_hours = max(min_hours, step_hours // 2)
-                continue
-            return False
-    return True
+
+def fetch_all_rows_chunked() -> List[Dict[str, Any]]:
+    start_dt = datetime.combine(_parse_date(START_DATE), datetime.min.time())
+    end_dt = datetime.combine(_parse_date(END_DATE), datetime.min.time())
+
+    window_days = max(1, int(os.environ.get("HB_WINDOW_DAYS", "7")))
+    windows = _windows(start_dt, end_dt, timedelta(days=window_days))
+
+    # Windows are independent, so fetch up to HB_PARALLEL at once; a window that comes back
+    # too large is split and its pieces are fetched in its place.
+    if httpx is not None:
+        results = asyncio.run(_fetch_windows_async(windows))
+    else:
+        results = _fetch_windows_threaded(windows)
+
+    # Reassemble in chronological order so keep="last" dedupe behaves as before
+    all_rows: List[Dict[str, Any]] = []
+    for key in sorted(results):
+        all_rows.extend(results[key])
+    return all_rows
 
 
 def main() -> None:
@@ -174,36 +253,49 @@ def main() -> None:
     if not rows:
         return
 
-    df = pd.DataFrame(rows)
+    # Dedupe, filter, sort and slice on the plain row list so the DataFrame (and the
+    # stiminfo flattening) only ever sees the rows that are actually shown.
+    # Columns are the union over all rows (as pd.DataFrame would see them), not just rows[0].
+    columns = set().union(*rows)
+    has_id = "server_trial_id" in columns
 
-    # Deduplicate if server_trial_id exists
-    if "server_trial_id" in df.columns:
-        before = len(df)
-        df = df.drop_duplicates(subset=["server_trial_id"], keep="last")
+    # Deduplicate if server_trial_id exists (last occurrence wins)
+    if has_id:
+        rows = list({r.get("server_trial_id"): r for r in rows}.values())
 
     # Apply status >= 0 (if column present)
-    if "status" in df.columns:
-        df = df[df["status"] >= 0]
+    if "status" in columns:
+        rows = [r for r in rows if r.get("status") is not None and r["status"] >= 0]
+
+    # Sort by server_trial_id desc if available, then take top 100
+    if has_id:
+        rows.sort(key=lambda r: r.get("server_trial_id") or 0, reverse=True)
+    count_after_filter = len(rows)
+    rows = rows[:100]
+
+    df = pd.DataFrame(rows)
 
-    # Extract trialinfo.stiminfo into its own dict column
+    # Extract trialinfo.stiminfo as a plain list of dicts (no intermediate Series); dicts
+    # short-circuit the decoder.
     stim_col = None
     if "trialinfo" in df.columns:
-        trialinfo_dicts = df["trialinfo"].apply(_ensure_dict)
-        stim_col = trialinfo_dicts.apply(lambda d: _ensure_dict(d.get("stiminfo")))
+        stim_col = [
+            _ensure_dict((x if type(x) is dict else _ensure_dict(x)).get("stiminfo"))
+            for x in df["trialinfo"].tolist()
+        ]
     elif "stiminfo" in df.columns:
-        stim_col = df["stiminfo"].apply(_ensure_dict)
+        stim_col = [x if type(x) is dict else _ensure_dict(x) for x in df["stiminfo"].tolist()]
 
     if stim_col is not None:
-        stiminfo_flat = pd.json_normalize(stim_col)
+        if STIMINFO_KEYS:
+            # Known schema: one list per column, no per-dict key discovery.
+            stiminfo_flat = pd.DataFrame({k: [d.get(k) for d in stim_col] for k in STIMINFO_KEYS})
+        else:
+            stiminfo_flat = pd.json_normalize(stim_col)
         if not stiminfo_flat.empty:
-            stiminfo_flat = stiminfo_flat.add_prefix("stiminfo.")
-            df = df.join(stiminfo_flat)
-
-    # Sort by server_trial_id desc if available, then take top 100
-    if "server_trial_id" in df.columns:
-        df = df.sort_values("server_trial_id", ascending=False)
-    count_after_filter = len(df)
-    df = df.head(100)
+            # Either builder returns a fresh RangeIndex; pin it to df's rows before joining.
+            stiminfo_flat.index = df.index
+            df = df.join(stiminfo_flat.add_prefix("stiminfo."))
 
     # Select and order key columns if they exist
     preferred_cols = [